@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+"""
+Benchmarks of fork's overhead for both the process and the thread path.
+
+    python benchmark.py                         # print a table
+    python benchmark.py --json new.json         # additionally store the results
+    python benchmark.py --compare old.json      # show changes against stored results
+
+Every benchmark runs once to warm up the pools and then --repeat times;
+the statistics are taken over those repetitions.
+"""
+from __future__ import print_function
+
+import os
+import sys
+import json
+import math
+import time
+import platform
+import argparse
+import multiprocessing
+
+import fork
+
+
+PATHS = ['process', 'thread']
+
+
+def noop(*args):
+    return None
+
+
+def identity(x):
+    return x
+
+
+def cascade(path, depth):
+    if depth == 0:
+        return 0
+    return fork.await(getattr(fork, path)(cascade, path, depth - 1)) + 1
+
+
+def sleepy(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def bench_submit(path, n):
+    """per-submit overhead: submitting n no-op jobs, without waiting for them"""
+    submit = getattr(fork, path)
+    start = time.time()
+    results = [submit(noop) for _ in range(n)]
+    elapsed = time.time() - start
+    fork.await_all(results)
+    return elapsed / n
+
+
+def bench_roundtrip(path, n):
+    """submit and evaluate n no-op jobs one after another"""
+    submit = getattr(fork, path)
+    start = time.time()
+    for _ in range(n):
+        fork.await(submit(noop))
+    return (time.time() - start) / n
+
+
+def bench_map(path, n, item_size):
+    """map throughput: seconds per item of item_size bytes sent there and back"""
+    map_ = getattr(fork, 'map_' + path)
+    items = [os.urandom(item_size) for _ in range(n)]      # distinct, so pickle cannot share them
+    start = time.time()
+    fork.await_all(map_(identity, items))
+    return (time.time() - start) / n
+
+
+def bench_block_map(path, n, item_size):
+    """block_map throughput: seconds per item of item_size bytes sent there and back"""
+    block_map = getattr(fork, 'block_map_' + path)
+    items = [os.urandom(item_size) for _ in range(n)]      # distinct, so pickle cannot share them
+    start = time.time()
+    block_map(identity, None, items)
+    return (time.time() - start) / n
+
+
+def bench_operator_chain(path, n):
+    """evaluating a chain of n additions of already finished results, per addition"""
+    results = [getattr(fork, path)(identity, 1) for _ in range(n)]
+    fork.await_all(results)
+    start = time.time()
+    total = 0
+    for result in results:
+        total += result
+    fork.await(total)
+    return (time.time() - start) / n
+
+
+def bench_await_any(path, n):
+    """await_any over n jobs of which only the first one finishes quickly"""
+    submit = getattr(fork, path)
+    results = [submit(sleepy, 0.0)] + [submit(sleepy, 0.01) for _ in range(n - 1)]
+    start = time.time()
+    fork.await_any(results)
+    elapsed = time.time() - start
+    fork.await_all(results)
+    return elapsed
+
+
+def bench_cascade(path, depth):
+    """cascading forks: seconds per level of a fork forking itself"""
+    start = time.time()
+    fork.await(getattr(fork, path)(cascade, path, depth))
+    return (time.time() - start) / depth
+
+
+def benchmarks(quick):
+    scale = 10 if quick else 1
+    for path in PATHS:
+        yield 'submit', path, bench_submit, {'n': 2000 // scale}
+        yield 'roundtrip', path, bench_roundtrip, {'n': 200 // scale}
+        for item_size in [16, 1024, 65536]:
+            yield 'map', path, bench_map, {'n': 1000 // scale, 'item_size': item_size}
+            yield 'block_map', path, bench_block_map, {'n': 1000 // scale, 'item_size': item_size}
+        yield 'operator_chain', path, bench_operator_chain, {'n': 1000 // scale}
+        for n in sorted(set([10, 100, 1000 // scale])):
+            yield 'await_any', path, bench_await_any, {'n': n}
+        yield 'cascade', path, bench_cascade, {'depth': 3}
+
+
+def statistics(samples):
+    samples = sorted(samples)
+    mean = sum(samples) / len(samples)
+    middle = len(samples) // 2
+    median = samples[middle] if len(samples) % 2 else (samples[middle - 1] + samples[middle]) / 2
+    stdev = math.sqrt(sum((sample - mean) ** 2 for sample in samples) / (len(samples) - 1)) if len(samples) > 1 else 0.0
+    return {'min': samples[0], 'median': median, 'mean': mean, 'stdev': stdev}
+
+
+def run(repeat, quick, only):
+    results = []
+    for name, path, benchmark, params in benchmarks(quick):
+        if only and name not in only:
+            continue
+        benchmark(path, **params)
+        samples = [benchmark(path, **params) for _ in range(repeat)]
+        result = {'name': name, 'path': path, 'params': params, 'unit': 's', 'samples': samples}
+        result.update(statistics(samples))
+        results.append(result)
+        print_result(result)
+    return results
+
+
+def key_of(result):
+    return (result['name'], result['path'], tuple(sorted(result['params'].items())))
+
+
+def print_result(result, previous=None):
+    line = '{name:<15} {path:<8} {params:<22} median {median:10.6f}s  min {min:10.6f}s  stdev {stdev:9.6f}s'.format(
+        name=result['name'], path=result['path'], median=result['median'], min=result['min'], stdev=result['stdev'],
+        params=' '.join('{0}={1}'.format(key, value) for key, value in sorted(result['params'].items())),
+    )
+    if previous is not None:
+        line += '  {0:+7.1%}'.format(result['median'] / previous['median'] - 1)
+    print(line)
+    sys.stdout.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='repetitions per benchmark (default: 5)')
+    parser.add_argument('--quick', action='store_true', help='use 10x smaller workloads')
+    parser.add_argument('--only', nargs='*', help='names of the benchmarks to run')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', help='compare the medians with the results stored in this file')
+    args = parser.parse_args()
+
+    results = run(args.repeat, args.quick, args.only)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'fork': fork.__version__,
+                'python': platform.python_version(),
+                'implementation': platform.python_implementation(),
+                'platform': platform.platform(),
+                'cpu_count': multiprocessing.cpu_count(),
+                'repeat': args.repeat,
+                'results': results,
+            }, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous_of = dict((key_of(result), result) for result in json.load(f)['results'])
+        print()
+        print('compared to', args.compare)
+        for result in results:
+            print_result(result, previous_of.get(key_of(result)))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,21 +1,53 @@
 # -*- coding: utf-8 -*-
 
+import os
 import sys
+import json
+import array
+import time
 import types
+import heapq
+import bisect
+import pickle
+import sqlite3
+import hashlib
+import shutil
+import tempfile
+import pstats
+import importlib
+import weakref
+import cProfile
+import inspect
+import linecache
+import itertools
 import traceback
 import threading
+import collections
 import multiprocessing
-from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED, ALL_COMPLETED
+import concurrent.futures.process
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED, FIRST_EXCEPTION, ALL_COMPLETED, TimeoutError, CancelledError
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+try:
+    import resource
+except ImportError:
+    resource = None
 
 __version__ = '0.37'
 __version_info__ = (0, 37)
 __all__ = [
     'submit', 'process', 'thread',
     'map', 'map_process', 'map_thread',
-    'block_map', 'block_map_process', 'block_map_thread',
-    'await', 'await_all', 'await_any',
-    'cpu_bound', 'io_bound',
-    'ResultEvaluationError',
+    'block_map', 'block_map_process', 'block_map_thread', 'block_map_array', 'map_reduce',
+    'await', 'await_all', 'await_any', 'set_await_all_policy',
+    'FIRST_EXCEPTION', 'ALL_COMPLETED',
+    'cpu_bound', 'io_bound', 'nogil_bound', 'hedged',
+    'ResultEvaluationError', 'ResultSet',
+    'Instrument', 'Tracer', 'Profiler', 'Metrics',
+    'stats', 'enable_metrics', 'disable_metrics',
+    'configure_processes', 'warmup', 'peak_memory', 'executor', 'Partition', 'checkpoint', 'Checkpoint',
     'evaluate', 'go', 'fork',
 ]
 
@@ -58,9 +90,9 @@ def map(callable_, *iterables):
     or as a thread depending on its io- or cpu-boundness
     for each item in iterables with *item as arguments.
 
-    Return an iterable of proxy objects for each future return value.
+    Return a ResultSet of the future return values.
     """
-    return [_submit(callable_, getattr(callable_, '__blocking_type__', 'cpu'), *args) for args in zip(*iterables)]
+    return _map(callable_, getattr(callable_, '__blocking_type__', 'cpu'), iterables)
 
 
 def map_process(callable_, *iterables):
@@ -68,11 +100,11 @@ def map_process(callable_, *iterables):
     Submit the callable to a background process for each item
     in iterables with *item as arguments.
 
-    Return an iterable of proxy objects for each future return value.
+    Return a ResultSet of the future return values.
 
     NOTE: Use only, if you really need control over the type of background execution.
     """
-    return [_submit(callable_, 'cpu', *args) for args in zip(*iterables)]
+    return _map(callable_, 'cpu', iterables)
 
 
 def map_thread(callable_, *iterables):
@@ -80,11 +112,11 @@ def map_thread(callable_, *iterables):
     Submit the callable to a background thread for each item
     in iterables with *item as arguments.
 
-    Return an iterable of proxy objects for each future return value.
+    Return a ResultSet of the future return values.
 
     NOTE: Use only, if you really need control over the type of background execution.
     """
-    return [_submit(callable_, 'io', *args) for args in zip(*iterables)]
+    return _map(callable_, 'io', iterables)
 
 
 def block_map(callable_, timeout=None, *iterables):
@@ -97,8 +129,11 @@ def block_map(callable_, timeout=None, *iterables):
 
     Raise concurrent.futures.TimeoutError if not all
     foreground jobs return in time.
+
+    Within a checkpoint block, return values are stored as they arrive
+    and read back instead of calling the callable again.
     """
-    return await_all([_submit(callable_, getattr(callable_, '__blocking_type__', 'cpu'), *args) for args in zip(*iterables)], timeout)
+    return _block_map(callable_, getattr(callable_, '__blocking_type__', 'cpu'), iterables, timeout)
 
 
 def block_map_process(callable_, timeout=None, *iterables):
@@ -111,7 +146,7 @@ def block_map_process(callable_, timeout=None, *iterables):
     Raise concurrent.futures.TimeoutError if not all
     foreground processes return in time.
     """
-    return await_all([_submit(callable_, 'cpu', *args) for args in zip(*iterables)], timeout)
+    return _block_map(callable_, 'cpu', iterables, timeout)
 
 
 def block_map_thread(callable_, timeout=None, *iterables):
@@ -124,7 +159,70 @@ def block_map_thread(callable_, timeout=None, *iterables):
     Raise concurrent.futures.TimeoutError if not all
     foreground threads return in time.
     """
-    return await_all([_submit(callable_, 'io', *args) for args in zip(*iterables)], timeout)
+    return _block_map(callable_, 'io', iterables, timeout)
+
+
+def block_map_array(callable_, arrays, axis=0, blocks=None, timeout=None):
+    """
+    Split the given numpy array or tuple of equally long arrays into contiguous blocks
+    along axis and submit the callable to a foreground job as a process or as a thread
+    depending on its io- or cpu-boundness for each block with the blocks of all arrays
+    as arguments. The callable needs to return an array block as long as its arguments.
+
+    Return one array assembled from the blocks returned.
+
+    blocks sets the number of blocks; by default there is one per worker unless the
+    arrays are too small to pay off. Processes receive and return their blocks through files
+    mapped into memory, threads work on views of the arrays; no item is pickled.
+
+    Raise ValueError if axis is out of range or the blocks returned do not fit together.
+    Raise concurrent.futures.TimeoutError if not all
+    foreground jobs return in time.
+    """
+    import numpy
+    if isinstance(arrays, numpy.ndarray):
+        arrays = (arrays,)
+    arrays = [numpy.asarray(array_) for array_ in arrays]
+    ndim = arrays[0].ndim
+    if not -ndim <= axis < ndim:
+        raise ValueError('axis {axis} is out of range for arrays of {ndim} dimensions'.format(axis=axis, ndim=ndim))
+    axis %= ndim                        # blocks are taken and assembled with slices in front of axis
+    length = arrays[0].shape[axis]
+    if any(array_.shape[axis] != length for array_ in arrays):
+        raise ValueError('arrays differ in length along axis {axis}'.format(axis=axis))
+    if not length:
+        return numpy.asarray(callable_(*arrays))
+    blocking_type = getattr(callable_, '__blocking_type__', 'cpu')
+    pool = _pool(blocking_type, callable_)
+    bounds = _array_blocks(length, sum(array_.nbytes for array_ in arrays), blocks, pool._max_workers)
+
+    if _shares_memory(pool) or any(array_.dtype.hasobject for array_ in arrays):
+        results = await_all([ResultProxy(_pool_submit(pool, blocking_type, callable_, callable_, *[_take(array_, start, stop, axis) for array_ in arrays]), 2) for start, stop in bounds], timeout)
+        return _assemble(results, bounds, length, axis)
+
+    directory = tempfile.mkdtemp(prefix='fork-', dir=_MAPPED_DIRECTORY if os.path.isdir(_MAPPED_DIRECTORY) else None)
+    try:
+        specs = [_mapped_spec(array_, os.path.join(directory, str(index))) for index, array_ in enumerate(arrays)]
+        results = await_all([ResultProxy(_pool_submit(pool, blocking_type, callable_, _call_mapped_block, callable_, specs, start, stop, axis, os.path.join(directory, 'out{start}'.format(start=start))), 2) for start, stop in bounds], timeout)
+        return _assemble([_mapped(spec) for spec in results], bounds, length, axis)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def map_reduce(mapper, reducer, *iterables):
+    """
+    Submit the mapper to background jobs as processes or as threads
+    depending on its io- or cpu-boundness for chunks of items in
+    iterables with *item as arguments.
+
+    Each job folds the return values of its chunk with reducer(a, b)
+    and sends back a single partial; adjacent partials are combined
+    by further background jobs as they arrive. The reducer needs
+    to be associative, not commutative.
+
+    Return the future reduced value.
+    """
+    return _map_reduce(mapper, reducer, getattr(mapper, '__blocking_type__', 'cpu'), iterables)
 
 
 def await(result_proxy, timeout=None):
@@ -135,53 +233,1075 @@ def await(result_proxy, timeout=None):
     return result_proxy.__future__.result(timeout)
 
 
-def await_all(result_proxies, timeout=None):
+def await_all(result_proxies, timeout=None, return_when=None, cancel_running=None):
     """
     Awaits the completion of the background jobs of all given result_proxies
     and returns their result values or raises the first exception encountered.
+
+    With return_when=FIRST_EXCEPTION, it returns control as soon as any background
+    job fails and cancels all sibling jobs that have not started yet. If cancel_running
+    is true, the workers of a process pool running siblings are terminated as well, but
+    only if the pool has no other jobs running or queued; the siblings queued there fail
+    with BrokenProcessPool. Running siblings in pools shared with other jobs and running
+    threads cannot be interrupted and will finish in the background.
+
+    Both default to the policy set by set_await_all_policy.
     """
-    wait([result_proxy.__future__ for result_proxy in result_proxies], timeout=timeout, return_when=ALL_COMPLETED)
-    return [result_proxy.__future__.result() for result_proxy in result_proxies]
+    if return_when is None:
+        return_when = _await_all_policy['return_when']
+    if cancel_running is None:
+        cancel_running = _await_all_policy['cancel_running']
+    if isinstance(result_proxies, ResultSet):
+        return result_proxies.await_all(timeout, return_when, cancel_running)
+    futures = [result_proxy.__future__ for result_proxy in result_proxies]
+    done, not_done = wait(futures, timeout=timeout, return_when=return_when)
+    if return_when == FIRST_EXCEPTION and not_done:
+        failed_futures = [future for future in futures if future in done and _failed(future)]
+        if failed_futures:
+            _cancel(not_done, cancel_running)
+            failed_futures[0].result()
+    return [future.result() for future in futures]
+
+
+def set_await_all_policy(return_when=ALL_COMPLETED, cancel_running=False):
+    """
+    Sets the default policy of await_all and thus of all block_map variants.
+
+    Use FIRST_EXCEPTION to fail fast, see await_all. While it is set, map
+    submits one job per item instead of chunks, so a failure is seen as soon
+    as its item has run.
+    """
+    if return_when not in (ALL_COMPLETED, FIRST_EXCEPTION):
+        raise RuntimeError('unknown return_when {return_when}'.format(return_when=return_when))
+    _await_all_policy['return_when'] = return_when
+    _await_all_policy['cancel_running'] = cancel_running
+
+
+_await_all_policy = {'return_when': ALL_COMPLETED, 'cancel_running': False}
 
 
 def await_any(result_proxies, timeout=None):
     """
     Awaits the completion of a background job of at least one given result_proxy
-    and return result values or raises the first exception encountered.
+    and returns the result_proxies of the jobs finished.
+
+    For a ResultSet, it returns result proxies of the items finished, in order.
     """
-    done_futures = wait([result_proxy.__future__ for result_proxy in result_proxies], timeout=timeout, return_when=FIRST_COMPLETED)
+    if isinstance(result_proxies, ResultSet):
+        return result_proxies.await_any(timeout)
+    done_futures = wait([result_proxy.__future__ for result_proxy in result_proxies], timeout=timeout, return_when=FIRST_COMPLETED).done
     return [result_proxy for result_proxy in result_proxies if result_proxy.__future__ in done_futures]
 
 
+def stats():
+    """
+    Returns the metrics collected since enable_metrics was called, see Metrics.snapshot.
+    """
+    if _metrics is None:
+        raise RuntimeError('metrics are not enabled; call enable_metrics first')
+    return _metrics.snapshot()
+
+
+def enable_metrics(pickled_sizes=False):
+    """
+    Starts collecting the metrics returned by stats; cheap enough to leave it on.
+    """
+    global _metrics
+    disable_metrics()
+    _metrics = Metrics(pickled_sizes).start()
+
+
+def disable_metrics():
+    """
+    Stops collecting the metrics returned by stats.
+    """
+    if _metrics in _instruments:
+        _metrics.stop()
+
+
+def configure_processes(max_workers=None, start_method=None, initializer=None, initargs=None, preload=None,
+                        max_tasks_per_worker=None, max_worker_rss=None, memory_budget=None, backend=None,
+                        reset=False):
+    """
+    Configures the process pools. Options not given keep their current values unless
+    reset restores the defaults first. The current pool is replaced once options it was
+    created with change.
+
+    backend runs cpu-bound jobs in 'processes', the default, or in 'threads'. Options
+    specific to processes only apply to processes; initializer runs in every thread.
+
+    NOTE: There is no backend for free-threaded builds or sub-interpreters: they need
+    Python 3.13 or later, and this module does not compile from Python 3.7 on, where
+    await is a keyword, until the function await is renamed.
+
+    start_method is one of multiprocessing.get_all_start_methods(). initializer(*initargs)
+    runs in every new worker process. The modules named in preload are imported before
+    any job arrives: once into the template process with 'forkserver' (only effective before
+    the forkserver has been started), once in the parent with 'fork', by each worker with 'spawn'.
+    warmup makes every worker run its initializer right away.
+
+    A process pool is replaced by a fresh one once one of its workers has run
+    max_tasks_per_worker jobs or exceeds max_worker_rss bytes after a job. Workers are
+    not replaced one by one: all workers of the pool are retired together. The old pool
+    finishes its queued jobs before its workers exit.
+
+    With memory_budget bytes, a job is only submitted when the peak memory of the running
+    jobs plus its own fits into the budget; otherwise submitting waits. The peak memory of
+    a callable is declared by peak_memory or learned conservatively from previous jobs.
+
+    NOTE: Before Python 3.7, start_method is set for all of multiprocessing and
+    initializer and preload run with the first job of each worker.
+    """
+    if start_method is not None and start_method not in multiprocessing.get_all_start_methods():
+        raise RuntimeError('unknown start_method {start_method}'.format(start_method=start_method))
+    if backend not in (None, 'processes', 'threads'):
+        raise RuntimeError('unknown backend {backend}'.format(backend=backend))
+    options = dict(_default_process_options) if reset else dict(_process_options)
+    given = dict(
+        max_workers=max_workers,
+        start_method=start_method,
+        initializer=initializer,
+        initargs=None if initargs is None else tuple(initargs),
+        preload=None if preload is None else tuple(preload),
+        max_tasks_per_worker=max_tasks_per_worker,
+        max_worker_rss=max_worker_rss,
+        memory_budget=memory_budget,
+        backend=backend,
+    )
+    options.update((name, value) for name, value in given.items() if value is not None)
+    _process_options.update(options)
+
+
+def peak_memory(size):
+    """
+    Declares the peak memory in bytes a call of the decorated callable needs on top
+    of its worker process; used for the memory budget of configure_processes.
+    """
+    def decorator(callable_):
+        callable_.__peak_memory__ = size
+        return callable_
+    return decorator
+
+
+def hedged(percentile=95, hedges=1, retries=0):
+    """
+    Decorator for idempotent callables: a job running longer than the given
+    percentile of recent run times of the callable gets a duplicate, up to
+    hedges of them; the first result wins and the others are cancelled unless
+    already running. A failed job is retried up to retries times.
+
+    percentile=None disables duplicates. Jobs of map carry chunks of items; a
+    chunk is duplicated as a whole, while its failed items are retried one by one
+    within the job. A chunk failing as a whole, e.g. when its worker crashes, is
+    retried as a whole. A failed job of map_reduce is retried as a whole.
+    """
+    def decorator(callable_):
+        callable_.__hedging__ = {'percentile': percentile, 'hedges': hedges if percentile is not None else 0, 'retries': retries}
+        return callable_
+    return decorator
+
+
+def executor(name, processes=None, threads=None, reserve=None, borrow=None):
+    """
+    Returns the executor partition of the given name, created on first call.
+
+    A partition has pools of its own: processes workers for cpu-bound jobs and threads
+    workers for io-bound and nogil-bound ones, so its jobs never queue behind the jobs
+    of other partitions or of the pools of the current thread. It keeps reserve workers
+    of each pool for itself; the others it lends to partitions with borrow=True whose
+    own pool is busy. Later calls change the options given; sizes apply to pools started
+    from then on.
+
+    Jobs submitted within a with block go to the partition of the innermost block, even if
+    their callable is decorated with another partition; the decorator applies outside of them.
+    Within background jobs, it does not apply at all: like all jobs submitted there, jobs of
+    decorated callables go to pools of the job, so a partition never waits for its own workers.
+
+        batch = fork.executor('batch', processes=4)
+        interactive = fork.executor('interactive', processes=2, reserve=1, borrow=True)
+
+        @batch
+        def train(data): ...            # jobs of train go to batch unless submitted in a with block
+
+        result = interactive.submit(predict, item)
+        with interactive:
+            results = fork.map(predict, items)
+    """
+    with _partitions_lock:
+        if name not in _partitions:
+            _partitions[name] = Partition(name)
+        partition = _partitions[name]
+    return partition.configure(processes, threads, reserve, borrow)
+
+
+def checkpoint(path):
+    """
+    Returns a checkpoint storing the return values of block_map and its variants
+    in the SQLite database at path. Within its with block, the values are written
+    as the jobs finish; values of items with equal callable name and arguments
+    found from earlier runs are read from the database instead of being computed.
+    The database is only open within the with block.
+
+        with fork.checkpoint('thumbnails.sqlite'):
+            thumbnails = fork.block_map(create_thumbnail, None, images)
+
+    Arguments need to be picklable to be recognized, return values to be stored.
+    """
+    return Checkpoint(path)
+
+
+def warmup():
+    """
+    Starts all workers of the process and thread pools of the current thread
+    and waits until each of them has run a job, so the first jobs do not pay
+    for starting and initializing them.
+    """
+    for blocking_type in ['cpu', 'io', 'nogil']:
+        pool = _pool(blocking_type)
+        workers = set()
+        # a busy worker leaves the next job to another one; repeat for the workers not reached
+        for _ in range(_WARMUP_ROUNDS):
+            futures = [_submit_to(pool, _warm) for _ in range(pool._max_workers)]
+            workers.update(future.result() for future in futures)
+            if len(workers) >= pool._max_workers:
+                break
+
+
+_default_process_options = {
+    'max_workers': None, 'start_method': None, 'initializer': None, 'initargs': (), 'preload': (),
+    'max_tasks_per_worker': None, 'max_worker_rss': None, 'memory_budget': None, 'backend': None,
+}
+_process_options = dict(_default_process_options)
+_POOL_OPTIONS = ('max_workers', 'start_method', 'initializer', 'initargs', 'preload')   # baked into a pool
+_WARMUP_ROUNDS = 10
+_WARMUP_HOLD = 0.01             # seconds a warmup job keeps its worker busy
+_initialized_by = set()         # (pool, thread) whose initializer ran in this worker, before Python 3.7
+_pool_ids = itertools.count()
+_replace_lock = threading.Lock()
+_memory = {'in_use': 0, 'peak_of': {}}
+_memory_condition = threading.Condition()
+_accounting = {'pid': os.getpid()}     # the process memory, resource groups and timers account for
+
+
 _pools_of = threading.local()
-_pools_of.processes = None
+_pools_of.processes = None     # the pool of cpu-bound jobs, processes unless configured otherwise
 _pools_of.threads = None
+_pools_of.nogil_threads = None
+_pools_of.manager = None
+_pools_of.in_job = False       # whether this thread runs a background job, see _safety_wrapper
+
+_all_pools = {'cpu': weakref.WeakSet(), 'io': weakref.WeakSet(), 'nogil': weakref.WeakSet()}
+
+_checkpoints_of = threading.local()    # current: stack of checkpoints entered as context managers
+_CHECKPOINT_BATCH_SIZE = 500            # fingerprints per query, below the limit of SQLite parameters
+
+_partitions = {}
+_partitions_of = threading.local()     # current: stack of partitions entered as context managers
+_partitions_lock = threading.RLock()
+
+_MAX_MAP_CHUNK_SIZE = 1024      # items per job of map
+_MAP_CHUNKS_PER_WORKER = 4      # jobs per worker map aims for to balance uneven items
+_ARRAY_TYPECODES = {int: 'q' if 'q' in getattr(array, 'typecodes', '') else 'l', float: 'd'}
+
+_MIN_ARRAY_BLOCK_BYTES = 1 << 16  # bytes per block of block_map_array at least
+_MAPPED_DIRECTORY = '/dev/shm'     # where blocks for processes are mapped from, if it exists
+
+_HEDGE_HISTORY = 100           # run times per callable hedging thresholds are taken from
+_HEDGE_MIN_SAMPLES = 10         # run times needed before jobs are duplicated
+
+_STREAM_CHUNK_SIZE = 64         # items per message sent from a streaming worker
+_STREAM_CHANNEL_SIZE = 16       # messages buffered before a streaming worker blocks
+_STREAM_FLUSH_INTERVAL = 0.05   # seconds after which an incomplete chunk is sent anyway
+_STREAM_POLL_INTERVAL = 0.1     # seconds between checks whether a streaming worker died
 
 
 def _submit(callable_, blocking_type, *args, **kwargs):
+    pool = _pool(blocking_type, callable_)
+    if inspect.isgeneratorfunction(callable_):
+        return ResultProxy(_streaming_future(pool, blocking_type, callable_, args, kwargs), 3)
+    future = _hedged_submit(pool, blocking_type, callable_, callable_, *args, **kwargs)
+    future.__pool__ = pool
+    return ResultProxy(future, 3)
+
+
+def _streaming_future(pool, blocking_type, callable_, args, kwargs):
+    # done right away: its result is the generator receiving what the job yields
+    future = Future()
+    channel, stopped = _channel(pool)
+    worker_future = _pool_submit(pool, blocking_type, callable_, _stream, channel, stopped, callable_, *args, **kwargs)
+    future.set_result(_receive(channel, stopped, worker_future, future))
+    return future
+
+
+def _pool(blocking_type, callable_=None):
+    partition = _partition_of(callable_)
+    if partition is not None:
+        return partition.pool(blocking_type)
     if blocking_type == 'cpu':
-        if not _pools_of.processes:
-            _pools_of.processes = ProcessPoolExecutor()
-        return ResultProxy(_pools_of.processes.submit(_safety_wrapper, callable_, *args, **kwargs), 3)
+        if _pools_of.processes:
+            _pools_of.processes = _live_pool(_pools_of.processes, _worn_out)
+        else:
+            _pools_of.processes = _cpu_pool()
+            _all_pools[blocking_type].add(_pools_of.processes)
+        return _pools_of.processes
     elif blocking_type == 'io':
         if not _pools_of.threads:
             _pools_of.threads = ThreadPoolExecutor(2 * (multiprocessing.cpu_count() or 1))
-        return ResultProxy(_pools_of.threads.submit(_safety_wrapper, callable_, *args, **kwargs), 3)
+            _all_pools[blocking_type].add(_pools_of.threads)
+        return _pools_of.threads
+    elif blocking_type == 'nogil':
+        if not _pools_of.nogil_threads:
+            _pools_of.nogil_threads = ThreadPoolExecutor(multiprocessing.cpu_count() or 1)
+            _all_pools[blocking_type].add(_pools_of.nogil_threads)
+        return _pools_of.nogil_threads
     raise RuntimeError('unknown blocking_type {blocking_type}'.format(blocking_type=blocking_type))
 
 
+def _cpu_backend():
+    return _process_options['backend'] or 'processes'
+
+
+def _cpu_pool(max_workers=None):
+    backend = _cpu_backend()
+    max_workers = max_workers or _process_options['max_workers']
+    if backend == 'processes':
+        pool = _process_pool(max_workers)
+    else:
+        max_workers = max_workers or multiprocessing.cpu_count() or 1
+        if _process_options['initializer'] is None:
+            pool = ThreadPoolExecutor(max_workers)
+        elif sys.version_info < (3, 7):
+            # no initializer yet: initialize each thread with its first job
+            pool = ThreadPoolExecutor(max_workers)
+            pool.__initializer__ = ('{pid}-{id}'.format(pid=os.getpid(), id=next(_pool_ids)), (), _process_options['initializer'], _process_options['initargs'])
+        else:
+            pool = ThreadPoolExecutor(max_workers, initializer=_process_options['initializer'], initargs=_process_options['initargs'])
+    pool.__backend__ = backend
+    pool.__options__ = tuple(_process_options[name] for name in _POOL_OPTIONS)
+    return pool
+
+
+def _partition_of(callable_):
+    current = getattr(_partitions_of, 'current', None)
+    if current:
+        return current[-1]
+    name = getattr(callable_, '__executor__', None)
+    if name is None or getattr(_pools_of, 'in_job', False):     # nested jobs use the pools of their job
+        return None
+    return executor(name)
+
+
+def _track(pool, future):
+    # the jobs in flight of partition pools tell whether they have workers to lend
+    if getattr(pool, '__in_flight__', None) is None:
+        return future
+    with _partitions_lock:
+        pool.__in_flight__ += 1
+    future.add_done_callback(lambda future: _untrack(pool))
+    return future
+
+
+def _untrack(pool):
+    with _partitions_lock:
+        pool.__in_flight__ -= 1
+
+
+def _shares_memory(pool):
+    return isinstance(pool, ThreadPoolExecutor)
+
+
+def _process_pool(max_workers):
+    options = _process_options
+    if not (options['start_method'] or options['initializer'] or options['preload']):
+        return ProcessPoolExecutor(max_workers)
+    if sys.version_info < (3, 7):
+        # neither mp_context nor initializer yet: set the start method globally, initialize with the first job
+        if options['start_method'] and multiprocessing.get_start_method(allow_none=True) != options['start_method']:
+            multiprocessing.set_start_method(options['start_method'], force=True)
+        worker_preload = _preload(multiprocessing, options['preload'])
+        pool = ProcessPoolExecutor(max_workers)
+        pool.__initializer__ = ('{pid}-{id}'.format(pid=os.getpid(), id=next(_pool_ids)), worker_preload, options['initializer'], options['initargs'])
+        return pool
+    context = multiprocessing.get_context(options['start_method'])
+    return ProcessPoolExecutor(
+        max_workers,
+        mp_context=context,
+        initializer=_initialize_worker,
+        initargs=(_preload(context, options['preload']), options['initializer'], options['initargs']),
+    )
+
+
+def _count_task(pool, record):
+    # workers of a pool cannot be replaced one by one: the first worker to reach the limit wears out the pool
+    max_tasks_per_worker = _process_options['max_tasks_per_worker']
+    if not max_tasks_per_worker or record.worker is None or not isinstance(pool, ProcessPoolExecutor):
+        return
+    tasks_of = pool.__dict__.setdefault('__tasks_of__', {})
+    pid = record.worker[0]
+    tasks_of[pid] = tasks_of.get(pid, 0) + 1
+    if tasks_of[pid] >= max_tasks_per_worker:
+        pool.__worn_out__ = True
+
+
+def _preload(context, preload):
+    # returns the modules left for the workers to import
+    start_method = context.get_start_method() if hasattr(context, 'get_start_method') else 'fork'
+    if start_method == 'forkserver':
+        context.set_forkserver_preload(list(preload))
+    elif start_method == 'fork':
+        for module in preload:
+            importlib.import_module(module)
+        return ()
+    return preload
+
+
+def _worn_out(pool):
+    if pool.__backend__ != _cpu_backend() or pool.__options__ != tuple(_process_options[name] for name in _POOL_OPTIONS):
+        return True
+    return getattr(pool, '__worn_out__', False) or _broken(pool)
+
+
+def _broken(pool):
+    return getattr(pool, '__terminated__', False) or bool(getattr(pool, '_broken', False))
+
+
+def _retire(pool):
+    # terminated workers may have died holding the queue lock shutdown needs; such pools break on their own
+    if not getattr(pool, '__terminated__', False):
+        pool.shutdown(wait=False)
+
+
+def _live_pool(pool, replaced_if=_broken):
+    # jobs submitted on behalf of earlier ones go to the pool that replaced theirs. Pools of cpu-bound jobs
+    # are replaced by whoever needs them first: broken ones by anyone, worn-out ones by the owner, as others
+    # may still be about to submit to them
+    while True:
+        successor = getattr(pool, '__successor__', None)
+        if successor is None and getattr(pool, '__backend__', None) is not None and replaced_if(pool):
+            successor = _replace(pool)
+        if successor is None:
+            return pool
+        pool = successor
+
+
+def _replace(pool):
+    with _replace_lock:
+        if getattr(pool, '__successor__', None) is None:
+            _retire(pool)
+            partition = getattr(pool, '__partition__', None)
+            successor = _cpu_pool(partition.processes if partition is not None else None)
+            if partition is not None:
+                successor.__partition__ = partition
+                successor.__in_flight__ = 0
+            _all_pools['cpu'].add(successor)
+            pool.__successor__ = successor
+        return pool.__successor__
+
+
+def _initialize_worker(preload, initializer, initargs):
+    for module in preload:
+        importlib.import_module(module)
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def _initialized(initializer, callable_, *args, **kwargs):
+    token, preload, function, initargs = initializer
+    key = (token, threading.current_thread().ident)     # workers of the threads backend share a process
+    if key not in _initialized_by:
+        _initialize_worker(preload, function, initargs)
+        _initialized_by.add(key)
+    return callable_(*args, **kwargs)
+
+
+def _submit_to(pool, callable_, *args, **kwargs):
+    initializer = getattr(pool, '__initializer__', None)
+    if initializer is None:
+        return pool.submit(callable_, *args, **kwargs)
+    return pool.submit(_initialized, initializer, callable_, *args, **kwargs)
+
+
+def _warm():
+    time.sleep(_WARMUP_HOLD)
+    return os.getpid(), threading.current_thread().ident
+
+
+def _pool_submit(pool, blocking_type, origin, callable_, *args, **kwargs):
+    return _submit_job(pool, blocking_type, origin, callable_, args, kwargs)
+
+
+def _submit_job(pool, blocking_type, origin, callable_, args, kwargs, wait=True):
+    # without wait, the job is admitted right away: callbacks and timers must not block
+    guarded = counted = False
+    if isinstance(pool, ProcessPoolExecutor):
+        counted = bool(_process_options['max_tasks_per_worker'])     # per worker, see _finished
+        guarded = bool(_process_options['max_worker_rss'] or _process_options['memory_budget'])
+    if not _instruments and not guarded and not counted:
+        return _track(pool, _submit_to(pool, _safety_wrapper, callable_, *args, **kwargs))
+    record = _TaskRecord(origin, blocking_type)
+    if callable_ is _map_chunk or callable_ is _reduce_chunk:
+        record.items = len(args[-1])    # a chunk of calls of origin
+    record.measure_memory = guarded
+    instruments = tuple(_instruments)
+    for instrument in instruments:
+        instrument.submitted(record)
+    if record.measure_sizes and isinstance(pool, ProcessPoolExecutor):
+        record.args_size = _pickled_size((callable_, args, kwargs))
+    if guarded and _process_options['memory_budget']:
+        record.admitted_memory = _admit(origin, record.name, wait)
+    try:
+        future = _submit_to(pool, _instrumented_wrapper, record, callable_, *args, **kwargs)
+    except BaseException:               # e.g. the pool is broken or shut down; the job never runs
+        _release(record)
+        raise
+    future.__pool__ = pool
+    future.__record__ = record
+    future.__instruments__ = instruments
+    future.add_done_callback(_finished)
+    return _track(pool, future)
+
+
+def _hedged_submit(pool, blocking_type, origin, callable_, *args, **kwargs):
+    return _hedged_job(pool, blocking_type, origin, callable_, args, kwargs)
+
+
+def _hedged_job(pool, blocking_type, origin, callable_, args, kwargs, wait=True):
+    hedging = getattr(origin, '__hedging__', None)
+    if hedging is None:
+        return _limited_submit(pool, blocking_type, origin, callable_, args, kwargs, wait)
+    return _Hedge(pool, blocking_type, origin, callable_, args, kwargs, hedging, wait).future
+
+
+def _limited_submit(pool, blocking_type, origin, callable_, args, kwargs, wait=True):
+    group = getattr(origin, '__resource_group__', None)
+    if group is None or blocking_type != 'io':
+        return _submit_job(pool, blocking_type, origin, callable_, args, kwargs, wait)
+    return group.submit(pool, blocking_type, origin, callable_, args, kwargs)
+
+
+def _unwrapped_result(future, timeout=None):
+    # futures of pool jobs are not patched by ResultProxy; instrumented jobs return an _Envelope
+    result = Future.result(future, timeout)
+    return result.result if '__record__' in future.__dict__ else result
+
+
+def _hedge_threshold(key, percentile):
+    with _latencies_lock:
+        latencies = sorted(_latencies_of.get(key, ()))
+    if len(latencies) < _HEDGE_MIN_SAMPLES:
+        return None
+    return latencies[min(len(latencies) - 1, int(len(latencies) * percentile / 100.0))]
+
+
+def _learn_latency(key, latency):
+    with _latencies_lock:
+        if key not in _latencies_of:
+            _latencies_of[key] = collections.deque(maxlen=_HEDGE_HISTORY)
+        _latencies_of[key].append(latency)
+
+
+def _schedule(delay, callback):
+    global _timer_thread
+    with _timers_condition:
+        heapq.heappush(_timers, (time.time() + delay, next(_timer_ids), callback))
+        if _timer_thread is None or not _timer_thread.is_alive():
+            _timer_thread = threading.Thread(target=_run_timers, name='fork-timers')
+            _timer_thread.daemon = True
+            _timer_thread.start()
+        _timers_condition.notify()
+
+
+def _run_timers():
+    while True:
+        with _timers_condition:
+            while not _timers or _timers[0][0] > time.time():
+                _timers_condition.wait(_timers[0][0] - time.time() if _timers else None)
+            callback = heapq.heappop(_timers)[2]
+        try:
+            callback()
+        except Exception:
+            traceback.print_exc()
+
+
+def _admit(callable_, name, wait=True):
+    # wait until the peak memory of the job fits into the budget; a job is always admitted when nothing runs
+    peak = getattr(callable_, '__peak_memory__', None)
+    if peak is None:
+        peak = _memory['peak_of'].get(name, 0)
+    with _memory_condition:
+        while wait and _memory['in_use'] and _memory['in_use'] + peak > _process_options['memory_budget']:
+            _memory_condition.wait()
+        _memory['in_use'] += peak
+    return peak
+
+
+def _release(record):
+    if record.measure_memory:
+        with _memory_condition:
+            if record.memory is not None:
+                _memory['peak_of'][record.name] = max(_memory['peak_of'].get(record.name, 0), record.memory)
+            _memory['in_use'] -= record.admitted_memory
+            _memory_condition.notify_all()
+
+
+def _map(callable_, blocking_type, iterables, stack_frames_to_pop_off=3):
+    return ResultSet(callable_, blocking_type, iterables, stack_frames_to_pop_off)
+
+
+def _block_map(callable_, blocking_type, iterables, timeout):
+    current = getattr(_checkpoints_of, 'current', None)
+    if not current or inspect.isgeneratorfunction(callable_):
+        return await_all(_map(callable_, blocking_type, iterables, 4), timeout)
+    return current[-1]._block_map(callable_, blocking_type, iterables, timeout)
+
+
+def _map_chunk_size(length, pool, origin, blocking_type):
+    if blocking_type == 'io' and getattr(origin, '__resource_group__', None) is not None:
+        return 1                        # the limits of a resource group count calls, not chunks
+    return max(1, min(_MAX_MAP_CHUNK_SIZE, -(-length // (_MAP_CHUNKS_PER_WORKER * pool._max_workers))))
+
+
+def _map_reduce(mapper, reducer, blocking_type, iterables):
+    args_list = list(zip(*iterables))
+    if not args_list:
+        raise TypeError('map_reduce() of empty iterables')
+    pool = _pool(blocking_type, mapper)
+    chunk_size = _map_chunk_size(len(args_list), pool, mapper, blocking_type)
+    future = Future()
+    reduction = _Reduction(future, pool, reducer, len(args_list))
+    for start in range(0, len(args_list), chunk_size):
+        chunk_future = _hedged_submit(pool, blocking_type, mapper, _reduce_chunk, mapper, reducer, args_list[start:start + chunk_size])
+        reduction.watch(chunk_future, start, min(start + chunk_size, len(args_list)))
+    return ResultProxy(future, 3)
+
+
+def _reduce_chunk(mapper, reducer, args_list):
+    iterator = iter(args_list)
+    result = mapper(*next(iterator))
+    for args in iterator:
+        result = reducer(result, mapper(*args))
+    return result
+
+
+def _map_chunk(callable_, args_list):
+    # stops at the first failure, so it is not held back by the rest of the chunk; see ResultSet
+    hedging = getattr(callable_, '__hedging__', None)
+    retries = hedging['retries'] if hedging is not None else 0
+    values = []
+    errors = {}
+    for index, args in enumerate(args_list):
+        try:
+            values.append(_retried(retries, callable_, *args))
+        except BaseException as exc:
+            values.append(None)
+            errors[index] = _transport_exception(exc, sys.exc_info()[2])
+            break
+    return _compact(values), errors
+
+
+def _retried(retries, callable_, *args):
+    # failed items of a chunk are retried in its job: the chunk itself does not fail
+    for attempt in range(retries):
+        try:
+            return callable_(*args)
+        except Exception:
+            pass
+    return callable_(*args)
+
+
+def _compact(values):
+    # plain ints and floats are stored and pickled as arrays; anything else stays a list
+    if not values:
+        return values
+    first_type = type(values[0])
+    if first_type not in _ARRAY_TYPECODES or any(type(value) is not first_type for value in values):
+        return values
+    try:
+        return array.array(_ARRAY_TYPECODES[first_type], values)
+    except OverflowError:
+        return values
+
+
+def _array_blocks(length, nbytes, blocks, workers):
+    if blocks is None:
+        # splitting arrays below _MIN_ARRAY_BLOCK_BYTES per block costs more than it gains
+        blocks = min(workers, nbytes // _MIN_ARRAY_BLOCK_BYTES)
+    blocks = max(1, min(blocks, length))
+    return [(length * index // blocks, length * (index + 1) // blocks) for index in range(blocks)]
+
+
+def _take(array_, start, stop, axis):
+    return array_[(slice(None),) * axis + (slice(start, stop),)]
+
+
+def _assemble(results, bounds, length, axis):
+    # the first block tells the dtype and the shape of the whole result
+    import numpy
+    results = [numpy.asarray(result) for result in results]
+    first = results[0]
+    if first.ndim <= axis:
+        raise ValueError('block returned has no axis {axis}'.format(axis=axis))
+    out = numpy.empty(first.shape[:axis] + (length,) + first.shape[axis + 1:], first.dtype)
+    for (start, stop), result in zip(bounds, results):
+        expected = first.shape[:axis] + (stop - start,) + first.shape[axis + 1:]
+        if result.shape != expected:
+            raise ValueError('block {start}:{stop} returned has shape {shape}, expected {expected}'.format(start=start, stop=stop, shape=result.shape, expected=expected))
+        _take(out, start, stop, axis)[...] = result
+    return out
+
+
+def _mapped_spec(array_, path):
+    # numpy cannot map empty files; such arrays travel as they are
+    import numpy
+    if not array_.nbytes:
+        return array_
+    mapped = numpy.memmap(path, array_.dtype, 'w+', shape=array_.shape)
+    mapped[...] = array_
+    mapped.flush()
+    return path, array_.shape, array_.dtype
+
+
+def _mapped(spec):
+    import numpy
+    if not isinstance(spec, tuple):
+        return spec
+    path, shape, dtype = spec
+    return numpy.memmap(path, dtype, 'c', shape=shape)
+
+
+def _call_mapped_block(callable_, specs, start, stop, axis, path):
+    import numpy
+    result = numpy.asarray(callable_(*[_take(_mapped(spec), start, stop, axis) for spec in specs]))
+    if result.dtype.hasobject:
+        return result
+    return _mapped_spec(result, path)
+
+
+def _channel(pool):
+    # the consumer sets stopped when it stops iterating early
+    if _shares_memory(pool):
+        return queue.Queue(_STREAM_CHANNEL_SIZE), threading.Event()
+    if not getattr(_pools_of, 'manager', None):
+        _pools_of.manager = multiprocessing.Manager()
+    return _pools_of.manager.Queue(_STREAM_CHANNEL_SIZE), _pools_of.manager.Event()
+
+
+def _stream(channel, stopped, callable_, *args, **kwargs):
+    # a flusher thread sends pending items after _STREAM_FLUSH_INTERVAL even while the generator is busy
+    chunk = []
+    lock = threading.Lock()
+    finished = threading.Event()
+    abandoned = threading.Event()
+
+    def send(message):
+        # stopped is only asked while the channel is full: a consumer that stopped takes no more messages
+        while not abandoned.is_set():
+            try:
+                channel.put(message, timeout=_STREAM_POLL_INTERVAL)
+                return
+            except queue.Full:
+                if stopped.is_set():
+                    abandoned.set()
+
+    def flush():
+        with lock:
+            if chunk:
+                send((chunk[:], None))
+                del chunk[:]
+
+    def flush_periodically():
+        while not finished.wait(_STREAM_FLUSH_INTERVAL) and not abandoned.is_set():
+            flush()
+
+    flusher = threading.Thread(target=flush_periodically, name='fork-stream-flusher')
+    flusher.daemon = True
+    flusher.start()
+    items = callable_(*args, **kwargs)
+    try:
+        for item in items:
+            with lock:
+                chunk.append(item)
+                full = len(chunk) >= _STREAM_CHUNK_SIZE
+            if full:
+                flush()
+            if abandoned.is_set():
+                items.close()
+                break
+    except BaseException as exc:
+        stop = _transport_exception(exc, sys.exc_info()[2])
+    else:
+        stop = StopIteration()
+    finished.set()
+    flusher.join()
+    send((chunk, stop))
+
+
+def _receive(channel, stopped, worker_future, future):
+    # closed or garbage-collected before the end, e.g. by a break, it lets the worker stop
+    complete = False
+    try:
+        while True:
+            try:
+                chunk, stop = channel.get(timeout=_STREAM_POLL_INTERVAL)
+            except queue.Empty:
+                if worker_future.done() and worker_future.exception() is not None:
+                    raise ResultEvaluationError(_original_traceback(future.__current_stack__, worker_future.exception()))
+                continue
+            for item in chunk:
+                yield item
+            if isinstance(stop, TransportException):
+                raise ResultEvaluationError(_original_traceback(future.__current_stack__, stop))
+            if stop is not None:
+                complete = True
+                return
+    finally:
+        if not complete:
+            try:
+                stopped.set()
+            except Exception:               # the manager has been shut down, and its workers with it
+                pass
+
+
+def _failed(future):
+    return not future.cancelled() and future.exception() is not None
+
+
+def _cancel(futures, cancel_running):
+    futures = [future for future in futures if getattr(future, '__pool__', None) is not None]
+    doomed_pools = set()
+    if cancel_running:
+        siblings = set(futures)
+        running_pools = set(future.__pool__ for future in futures if future.running() and isinstance(future.__pool__, ProcessPoolExecutor))
+        doomed_pools = set(pool for pool in running_pools if _terminate(pool, siblings))
+    for future in futures:
+        if future.__pool__ not in doomed_pools:
+            future.cancel()
+
+
+def _terminate(pool, siblings):
+    # there is no public API to abort running jobs; kill the workers, the pool notices and breaks.
+    # Pools with jobs other than the siblings are spared; the lock keeps new jobs out meanwhile
+    with pool._shutdown_lock:
+        if any(item.future not in siblings and not item.future.done() for item in list(pool._pending_work_items.values())):
+            return False
+        for process in list((pool._processes or {}).values()):
+            process.terminate()
+        pool.__terminated__ = True
+        pool.__worn_out__ = True            # replaced with the next job, in partitions as well
+    # before Python 3.9, the exit handler of concurrent.futures writes to the result queue
+    # whose lock a killed worker may hold; the queue management thread is a daemon there
+    getattr(concurrent.futures.process, '_threads_queues', {}).pop(getattr(pool, '_queue_management_thread', None), None)
+    return True
+
+
 def _safety_wrapper(callable_, *args, **kwargs):
+    if _accounting['pid'] != os.getpid():
+        _forget_parent_jobs()
     _pools_of.processes = None
     _pools_of.threads = None
+    _pools_of.nogil_threads = None
+    _pools_of.manager = None
+    _pools_of.in_job = True
     try:
         return callable_(*args, **kwargs)
     except BaseException as exc:
-        raise TransportException(exc, traceback.format_tb(sys.exc_info()[2])[1:] + traceback.format_exception_only(type(exc), exc))
+        raise _transport_exception(exc, sys.exc_info()[2])
     finally:
+        _pools_of.in_job = False
         if _pools_of.processes:
             _pools_of.processes.shutdown()
         if _pools_of.threads:
             _pools_of.threads.shutdown()
+        if _pools_of.nogil_threads:
+            _pools_of.nogil_threads.shutdown()
+        if _pools_of.manager:
+            _pools_of.manager.shutdown()
+
+
+def _forget_parent_jobs():
+    # forked workers inherit the memory in use, the waiting and running jobs of resource
+    # groups and the timers of the parent; none of them is ever released in the worker
+    global _memory_condition, _timers_condition
+    _accounting['pid'] = os.getpid()
+    _memory['in_use'] = 0
+    _memory_condition = threading.Condition()
+    for group in _resource_groups.values():
+        group.reset()
+    del _timers[:]
+    _timers_condition = threading.Condition()
+
+
+def _transport_exception(exc, traceback_):
+    # frames as (filename, lineno, name) without source lines, which are looked up when
+    # displayed; equal stacks share one tuple, so pickle sends them once per message even
+    # if the exceptions raised there differ
+    frames = []
+    traceback_ = traceback_.tb_next         # the frame catching the exception
+    while traceback_ is not None:
+        code = traceback_.tb_frame.f_code
+        frames.append((code.co_filename, traceback_.tb_lineno, code.co_name))
+        traceback_ = traceback_.tb_next
+    if len(_traceback_frames) >= _MAX_TRACEBACK_INFOS or len(_traceback_infos) >= _MAX_TRACEBACK_INFOS:
+        _traceback_frames.clear()
+        _traceback_infos.clear()
+    frames = tuple(frames)
+    traceback_info = (_traceback_frames.setdefault(frames, frames), tuple(traceback.format_exception_only(type(exc), exc)))
+    return TransportException(exc, _traceback_infos.setdefault(traceback_info, traceback_info))
+
+
+def _current_stack(stack_frames_to_pop_off):
+    # what traceback.format_stack()[:-stack_frames_to_pop_off] of the caller would format
+    frames = []
+    frame = sys._getframe(1 + stack_frames_to_pop_off)
+    while frame is not None:
+        frames.append((frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name))
+        frame = frame.f_back
+    frames.reverse()
+    return tuple(frames)
+
+
+def _format_frames(frames):
+    lines = []
+    for filename, lineno, name in frames:
+        lines.append('  File "{filename}", line {lineno}, in {name}\n'.format(filename=filename, lineno=lineno, name=name))
+        line = linecache.getline(filename, lineno).strip()
+        if line:
+            lines.append('    {line}\n'.format(line=line))
+    return lines
+
+
+def _instrumented_wrapper(record, callable_, *args, **kwargs):
+    record.worker = (os.getpid(), threading.current_thread().ident)
+    profiler = _start_profiler() if record.profile else None
+    memory_before = (_rss(), _peak_rss()) if record.measure_memory else None
+    record.started = time.time()
+    try:
+        result = _safety_wrapper(callable_, *args, **kwargs)
+    except TransportException as exc:
+        record.ended = time.time()
+        record.stats = _stop_profiler(profiler)
+        _measure_memory(record, memory_before)
+        exc.record = record
+        raise
+    record.ended = time.time()
+    record.stats = _stop_profiler(profiler)
+    _measure_memory(record, memory_before)
+    if callable_ is _map_chunk:
+        record.items = len(result[0])   # stopped at its first failure; the rest is another job
+    if record.measure_sizes and record.worker[0] != record.submitter[0]:
+        record.result_size = _pickled_size(result)
+    return _Envelope(result, record)
+
+
+def _measure_memory(record, memory_before):
+    if memory_before is None:
+        return
+    rss_before, peak_before = memory_before
+    record.rss = _rss()
+    peak = _peak_rss()
+    # only a new peak of the process tells how much the job needed; otherwise take what it left behind
+    record.memory = peak - rss_before if peak > peak_before else max(record.rss - rss_before, 0)
+
+
+def _rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, AttributeError):
+        return _peak_rss()
+
+
+def _peak_rss():
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _start_profiler():
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:                      # another profiler is active in this process already
+        return None
+    return profiler
+
+
+def _stop_profiler(profiler):
+    if profiler is None:
+        return None
+    profiler.disable()
+    profiler.create_stats()
+    return profiler.stats
+
+
+def _finished(future):
+    record = future.__record__
+    if future.cancelled():
+        record.cancelled = True
+        _release(record)
+        for instrument in future.__instruments__:
+            instrument.finished(record)
+        return
+    exc = Future.exception(future)      # bypass the patched result method of ResultProxy
+    if exc is None:
+        worker_record = Future.result(future).record
+    else:
+        worker_record = getattr(exc, 'record', None)
+        record.failed = True
+    if worker_record is not None and worker_record is not record:
+        for name in _TaskRecord.worker_fields:
+            setattr(record, name, getattr(worker_record, name))
+    _release(record)
+    _count_task(future.__pool__, record)
+    max_worker_rss = _process_options['max_worker_rss']
+    if max_worker_rss and record.rss is not None and record.rss > max_worker_rss:
+        future.__pool__.__worn_out__ = True
+    for instrument in future.__instruments__:
+        instrument.finished(record)
+
+
+def _evaluate(future, record, timeout):
+    evaluating = time.time()
+    if not future.done():
+        wait([future], timeout=timeout)
+        if not future.done():
+            return
+    record.evaluating = evaluating
+    record.evaluated = time.time()
+    record.evaluator = (os.getpid(), threading.current_thread().ident)
+    for instrument in future.__instruments__:
+        instrument.evaluated(record)
+
+
+def _pickled_size(obj):
+    try:
+        return len(pickle.dumps(obj, pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return None
+
+
+def _name_of(callable_):
+    name = getattr(callable_, '__qualname__', None) or getattr(callable_, '__name__', None)
+    if name is None:
+        return repr(callable_)
+    module = getattr(callable_, '__module__', None)
+    return '{module}.{name}'.format(module=module, name=name) if module else name
+
+
+_instruments = []
+_traceback_frames = {}
+_traceback_infos = {}
+_MAX_TRACEBACK_INFOS = 1024     # distinct stacks and tracebacks a worker shares between failures
+_resource_groups = {}
+_latencies_of = {}
+_latencies_lock = threading.Lock()
+_timers = []
+_timer_ids = itertools.count()
+_timers_condition = threading.Condition()
+_timer_thread = None
+_task_ids = itertools.count()
+_metrics = None
 
 
 def cpu_bound(callable_):
@@ -192,25 +1312,601 @@ def cpu_bound(callable_):
     return callable_
 
 
-def io_bound(callable_):
+def io_bound(callable_=None, limit=None, group=None, rate=None):
     """
     Marks callable as mainly io-bound and safe for running off the MainThread.
+
+    With limit or rate, at most limit jobs of the callable run at once and at most
+    rate of them start per second; callables of the same group share these limits.
+    Waiting jobs do not occupy threads, so other io-bound jobs keep flowing.
+
+        @io_bound(limit=8, group='db')
+        def query(sql): ...
     """
+    if callable_ is None:
+        return lambda callable_: io_bound(callable_, limit, group, rate)
     callable_.__blocking_type__ = 'io'
+    if limit or rate or group:
+        name = group or _name_of(callable_)
+        if name not in _resource_groups:
+            _resource_groups[name] = _ResourceGroup(name)
+        callable_.__resource_group__ = _resource_groups[name].configure(limit, rate)
+    return callable_
+
+
+def nogil_bound(callable_):
+    """
+    Marks callable as mainly cpu-bound while releasing the GIL, e.g. in numpy, zlib or
+    hashlib, and safe for running off the MainThread. It runs in threads, one per core,
+    so neither arguments nor return values are pickled.
+    """
+    callable_.__blocking_type__ = 'nogil'
     return callable_
 
 
+class Partition(object):
+    """
+    An executor partition with pools of its own, see executor.
+
+    Decorating a callable with it sends all jobs of the callable to it; within a with
+    block, all jobs submitted by the current thread go to it.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.processes = None
+        self.threads = None
+        self.reserve = 0
+        self.borrow = False
+        self._pools = {}
+        self._pid = None
+
+    def configure(self, processes=None, threads=None, reserve=None, borrow=None):
+        with _partitions_lock:
+            self.processes = processes or self.processes
+            self.threads = threads or self.threads
+            self.reserve = self.reserve if reserve is None else reserve
+            self.borrow = self.borrow if borrow is None else borrow
+        return self
+
+    def __call__(self, callable_):
+        callable_.__executor__ = self.name
+        return callable_
+
+    def __enter__(self):
+        if not getattr(_partitions_of, 'current', None):
+            _partitions_of.current = []
+        _partitions_of.current.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback_):
+        _partitions_of.current.pop()
+
+    def submit(self, callable_, *args, **kwargs):
+        """
+        Submit the callable to a background job of this partition, see fork.submit.
+        """
+        with self:
+            return _submit(callable_, getattr(callable_, '__blocking_type__', 'cpu'), *args, **kwargs)
+
+    def map(self, callable_, *iterables):
+        """
+        Submit the callable to background jobs of this partition for each item, see fork.map.
+        """
+        with self:
+            return _map(callable_, getattr(callable_, '__blocking_type__', 'cpu'), iterables)
+
+    def pool(self, blocking_type):
+        with _partitions_lock:
+            own = self._own_pool(blocking_type)
+            if not self.borrow or own.__in_flight__ < own._max_workers:
+                return own
+            for lender in _partitions.values():
+                lent = lender._lent_pool(blocking_type) if lender is not self else None
+                if lent is not None:
+                    return lent
+            return own
+
+    def _own_pool(self, blocking_type):
+        if self._pid != os.getpid():            # pools inherited from the parent process are useless
+            self._pools = {}
+            self._pid = os.getpid()
+        pool = self._pools.get(blocking_type)
+        if pool is not None and blocking_type == 'cpu':
+            pool = self._pools[blocking_type] = _live_pool(pool, _worn_out)
+        if pool is None:
+            if blocking_type == 'cpu':
+                pool = _cpu_pool(self.processes)
+            elif blocking_type == 'io':
+                pool = ThreadPoolExecutor(self.threads or 2 * (multiprocessing.cpu_count() or 1))
+            elif blocking_type == 'nogil':
+                pool = ThreadPoolExecutor(self.threads or multiprocessing.cpu_count() or 1)
+            else:
+                raise RuntimeError('unknown blocking_type {blocking_type}'.format(blocking_type=blocking_type))
+            pool.__partition__ = self
+            pool.__in_flight__ = 0
+            self._pools[blocking_type] = pool
+            _all_pools[blocking_type].add(pool)
+        return pool
+
+    def _lent_pool(self, blocking_type):
+        # only pools already started lend their idle workers
+        pool = self._pools.get(blocking_type) if self._pid == os.getpid() else None
+        if pool is None or (blocking_type == 'cpu' and _worn_out(pool)):
+            return None
+        if pool.__in_flight__ < pool._max_workers - self.reserve:
+            return pool
+        return None
+
+
+class Checkpoint(object):
+    """
+    Store of return values of block_map, see checkpoint.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = None         # open while any with block of this checkpoint is
+        self._entered = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        with self._lock:
+            if self._connection is None:
+                self._connection = self._connect()
+            self._entered += 1
+        if not getattr(_checkpoints_of, 'current', None):
+            _checkpoints_of.current = []
+        _checkpoints_of.current.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback_):
+        _checkpoints_of.current.pop()
+        with self._lock:
+            self._entered -= 1
+            if not self._entered:
+                self._close()
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS results ('
+            'callable TEXT NOT NULL, fingerprint TEXT NOT NULL, result BLOB NOT NULL, '
+            'PRIMARY KEY (callable, fingerprint))'
+        )
+        connection.commit()
+        return connection
+
+    def _close(self):
+        # closing the last connection checkpoints the write-ahead log into the database file
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _block_map(self, callable_, blocking_type, iterables, timeout):
+        name = _name_of(callable_)
+        args_list = list(zip(*iterables))
+        fingerprints = [_fingerprint(args) for args in args_list]
+        stored = self._load(name, [fingerprint for fingerprint in fingerprints if fingerprint is not None])
+        missing = [index for index, fingerprint in enumerate(fingerprints) if fingerprint not in stored]
+        result_set = ResultSet(callable_, blocking_type, list(zip(*[args_list[index] for index in missing])), 4)
+        computing = [fingerprints[index] for index in missing]
+        claimed = set()
+        result_set._watch(lambda future, start: self._store(name, computing, start, future, claimed))
+        try:
+            computed = iter(await_all(result_set, timeout))
+        finally:
+            # waiters may wake up before done callbacks have run; store what is missing now
+            for future, start in result_set._pieces():
+                if future.done():
+                    self._store(name, computing, start, future, claimed)
+        return [stored[fingerprint] if fingerprint in stored else next(computed) for fingerprint in fingerprints]
+
+    def _load(self, name, fingerprints):
+        stored = {}
+        with self._lock:
+            for start in range(0, len(fingerprints), _CHECKPOINT_BATCH_SIZE):
+                batch = fingerprints[start:start + _CHECKPOINT_BATCH_SIZE]
+                rows = self._connection.execute(
+                    'SELECT fingerprint, result FROM results WHERE callable = ? AND fingerprint IN ({0})'.format(', '.join('?' * len(batch))),
+                    [name] + batch,
+                )
+                for fingerprint, result in rows:
+                    stored[fingerprint] = pickle.loads(bytes(result))
+        return stored
+
+    def _store(self, name, fingerprints, start, future, claimed):
+        with self._lock:
+            if self._connection is None or future in claimed or future.cancelled():
+                return                  # jobs finishing after the with block are not stored
+            claimed.add(future)
+            try:
+                values, errors = _unwrapped_result(future)
+            except BaseException:       # the whole piece failed; nothing to store
+                return
+            rows = []
+            for offset, (fingerprint, value) in enumerate(zip(fingerprints[start:start + len(values)], values)):
+                if fingerprint is None or offset in errors:
+                    continue
+                try:
+                    rows.append((name, fingerprint, sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))))
+                except Exception:       # unpicklable return value
+                    pass
+            self._connection.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?)', rows)
+            self._connection.commit()
+
+
+def _fingerprint(args):
+    try:
+        return hashlib.sha1(pickle.dumps(args, 2)).hexdigest()
+    except Exception:                   # unpicklable arguments are never taken from a checkpoint
+        return None
+
+
 class TransportException(Exception):
 
     #FIXME: remove default parameters when https://github.com/agronholm/pythonfutures/issues/30 is fixed
     def __init__(self, exc=None, traceback_info=None):
         self.exc = exc
-        self.traceback_info = traceback_info
+        self.traceback_info = traceback_info    # (frames, formatted exception), see _transport_exception
 
 
 class ResultEvaluationError(Exception):
 
-    pass
+    # failed jobs pass an _OriginalTraceback, formatted only once the message is needed
+    @property
+    def args(self):
+        args = BaseException.args.__get__(self)
+        if args and isinstance(args[0], _OriginalTraceback):
+            args = (str(args[0]),) + args[1:]
+            BaseException.args.__set__(self, args)
+        return args
+
+    @args.setter
+    def args(self, args):
+        BaseException.args.__set__(self, args)
+
+
+class _TaskRecord(object):
+
+    # attributes filled in by the worker which need to be copied back from process workers
+    worker_fields = ('worker', 'started', 'ended', 'items', 'result_size', 'stats', 'rss', 'memory')
+
+    def __init__(self, callable_, blocking_type):
+        self.id = next(_task_ids)
+        self.name = _name_of(callable_)
+        self.blocking_type = blocking_type
+        self.items = 1
+        self.submitter = (os.getpid(), threading.current_thread().ident)
+        self.submitted = time.time()
+        self.worker = None
+        self.started = None
+        self.ended = None
+        self.failed = False
+        self.cancelled = False
+        self.evaluator = None
+        self.evaluating = None
+        self.evaluated = None
+        self.args_size = None
+        self.result_size = None
+        self.measure_sizes = False
+        self.profile = False
+        self.stats = None
+        self.measure_memory = False
+        self.admitted_memory = 0
+        self.rss = None
+        self.memory = None
+
+
+class _Envelope(object):
+
+    def __init__(self, result, record):
+        self.result = result
+        self.record = record
+
+
+class Instrument(object):
+    """
+    Base class of hooks observing background jobs while started.
+
+    Override submitted, finished and evaluated; each receives the record of a job with
+    the attributes id, name, blocking_type, items, submitter, submitted, worker, started,
+    ended, failed, cancelled, evaluator, evaluating, evaluated, args_size and result_size.
+    Times are time.time() values; submitter, worker and evaluator are (pid, thread id) pairs.
+    A job of map or map_reduce runs a chunk of items calls of the callable; for all other
+    jobs items is 1.
+    Hooks run in arbitrary threads and should return quickly.
+    """
+
+    def start(self):
+        _instruments.append(self)
+        return self
+
+    def stop(self):
+        _instruments.remove(self)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def submitted(self, record):
+        """
+        Called in the submitting thread before the job is sent off.
+        """
+
+    def finished(self, record):
+        """
+        Called when the job is done, failed or has been cancelled.
+        """
+
+    def evaluated(self, record):
+        """
+        Called when a result proxy has been evaluated the first time.
+        """
+
+
+class Tracer(Instrument):
+    """
+    Records when background jobs are submitted, started, ended and evaluated
+    and which worker ran them. Pickled bytes are recorded only with
+    pickled_sizes=True as measuring them pickles arguments and results twice.
+
+    The most recent capacity jobs are kept. Use it as a context manager or call
+    start and stop; export the timeline with export_chrome_trace.
+    """
+
+    def __init__(self, capacity=65536, pickled_sizes=False):
+        self.records = collections.deque(maxlen=capacity)
+        self.pickled_sizes = pickled_sizes
+
+    def submitted(self, record):
+        record.measure_sizes = record.measure_sizes or self.pickled_sizes
+
+    def finished(self, record):
+        self.records.append(record)
+
+    def chrome_trace_events(self):
+        """
+        Returns the recorded jobs as Chrome trace events: one lane per worker thread
+        showing the run times, queue waits as async spans of the submitting thread
+        and evaluation waits on the evaluating thread.
+        """
+        events = []
+        lanes = set()
+        for record in list(self.records):
+            args = {
+                'id': record.id,
+                'blocking_type': record.blocking_type,
+                'items': record.items,
+                'failed': record.failed,
+                'args_size': record.args_size,
+                'result_size': record.result_size,
+            }
+            if record.started is not None:
+                lanes.add(record.worker)
+                lanes.add(record.submitter)
+                events.append(_chrome_trace_event(record.name, 'run', 'X', record.worker, record.started, args=args, dur=_us(record.ended - record.started)))
+                events.append(_chrome_trace_event(record.name, 'queue', 'b', record.submitter, record.submitted, id=record.id))
+                events.append(_chrome_trace_event(record.name, 'queue', 'e', record.submitter, record.started, id=record.id))
+            if record.evaluated is not None:
+                lanes.add(record.evaluator)
+                events.append(_chrome_trace_event(record.name, 'evaluate', 'X', record.evaluator, record.evaluating, args=args, dur=_us(record.evaluated - record.evaluating)))
+        for pid in set(pid for pid, tid in lanes):
+            name = 'parent' if pid == os.getpid() else 'worker'
+            events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': '{name} {pid}'.format(name=name, pid=pid)}})
+        return events
+
+    def export_chrome_trace(self, file):
+        """
+        Writes the recorded jobs to the given path or file object in the Chrome trace-event
+        format; open it with chrome://tracing or https://ui.perfetto.dev.
+        """
+        trace = {'traceEvents': self.chrome_trace_events(), 'displayTimeUnit': 'ms'}
+        if hasattr(file, 'write'):
+            json.dump(trace, file)
+        else:
+            with open(file, 'w') as f:
+                json.dump(trace, f)
+
+
+class Profiler(Instrument):
+    """
+    Profiles background jobs with cProfile in their workers while started
+    and merges the statistics sent back per callable.
+
+    Use it as a context manager or call start and stop; get a pstats.Stats
+    report with stats.
+    """
+
+    def __init__(self):
+        self.stats_of = {}
+        self._lock = threading.Lock()
+
+    def submitted(self, record):
+        record.profile = True
+
+    def finished(self, record):
+        if not record.stats:
+            return
+        stats = pstats.Stats(_RawStats(record.stats))
+        with self._lock:
+            if record.name in self.stats_of:
+                self.stats_of[record.name].add(stats)
+            else:
+                self.stats_of[record.name] = stats
+
+    def stats(self, name=None, stream=None):
+        """
+        Returns the pstats.Stats of the given callable name, e.g. 'module.function',
+        or of all profiled background jobs merged.
+        """
+        with self._lock:
+            if name is not None:
+                stats_list = [self.stats_of[name]]
+            else:
+                stats_list = list(self.stats_of.values())
+            if not stats_list:
+                raise RuntimeError('no background jobs profiled yet')
+            stats = pstats.Stats(_RawStats(dict(stats_list[0].stats)), stream=stream)
+            return stats.add(*stats_list[1:])
+
+
+class Metrics(Instrument):
+    """
+    Counts background jobs and the calls they made and keeps latency histograms of
+    their queue waits, run times and evaluation waits per callable and blocking type.
+    Jobs of map and map_reduce make a chunk of calls each: calls counts the calls,
+    and a run time sample of such a job is the time its whole chunk took.
+
+    Pickled bytes are counted only with pickled_sizes=True as measuring them
+    pickles arguments and results twice. Get the figures with snapshot.
+    """
+
+    def __init__(self, pickled_sizes=False):
+        self.pickled_sizes = pickled_sizes
+        self.started = time.time()
+        self._of = {}
+        self._in_flight = collections.defaultdict(int)
+        self._busy = collections.defaultdict(float)
+        self._lock = threading.Lock()
+
+    def submitted(self, record):
+        record.measure_sizes = record.measure_sizes or self.pickled_sizes
+        with self._lock:
+            self._in_flight[record.blocking_type] += 1
+            self._metrics_of(record)['submitted'] += 1
+
+    def finished(self, record):
+        with self._lock:
+            self._in_flight[record.blocking_type] -= 1
+            metrics = self._metrics_of(record)
+            if record.cancelled:
+                metrics['cancelled'] += 1
+                return
+            metrics['failed' if record.failed else 'finished'] += 1
+            metrics['calls'] += record.items
+            if record.started is not None:
+                metrics['queue_wait'].observe(record.started - record.submitted)
+                metrics['run_time'].observe(record.ended - record.started)
+                self._busy[record.blocking_type] += record.ended - record.started
+            metrics['args_bytes'] += record.args_size or 0
+            metrics['result_bytes'] += record.result_size or 0
+
+    def evaluated(self, record):
+        with self._lock:
+            self._metrics_of(record)['evaluate_wait'].observe(record.evaluated - record.evaluating)
+
+    def _metrics_of(self, record):
+        key = (record.name, record.blocking_type)
+        if key not in self._of:
+            self._of[key] = {
+                'submitted': 0, 'finished': 0, 'failed': 0, 'cancelled': 0, 'calls': 0,
+                'args_bytes': 0, 'result_bytes': 0,
+                'queue_wait': _Histogram(), 'run_time': _Histogram(), 'evaluate_wait': _Histogram(),
+            }
+        return self._of[key]
+
+    def snapshot(self):
+        """
+        Returns the current figures as plain dicts:
+        pools maps each blocking type to its worker count, jobs in flight, estimated
+        running and queued jobs, utilization and busy seconds; callables maps callable
+        names and blocking types to counters and histograms (seconds).
+        """
+        with self._lock:
+            pools = {}
+            for blocking_type in set(_all_pools) | set(self._in_flight):
+                in_flight = self._in_flight[blocking_type]
+                workers = sum(pool._max_workers for pool in list(_all_pools.get(blocking_type, ())))
+                running = min(in_flight, workers)
+                pools[blocking_type] = {
+                    'workers': workers,
+                    'in_flight': in_flight,
+                    'running': running,
+                    'queued': in_flight - running,
+                    'utilization': float(running) / workers if workers else 0.0,
+                    'busy_seconds': self._busy[blocking_type],
+                }
+            callables = {}
+            for (name, blocking_type), metrics in self._of.items():
+                callables.setdefault(name, {})[blocking_type] = dict(
+                    (key, value.snapshot() if isinstance(value, _Histogram) else value)
+                    for key, value in metrics.items()
+                )
+            return {'uptime': time.time() - self.started, 'pools': pools, 'callables': callables}
+
+
+class _Histogram(object):
+
+    # exponential buckets from 10us to about 84s
+    bounds = [0.00001 * 2 ** i for i in range(24)]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        if not self.count:
+            return None
+        rank = p / 100.0 * self.count
+        seen = 0
+        for bound, count in zip(self.bounds + [self.max], self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'buckets': list(zip(self.bounds + [float('inf')], self.counts)),
+        }
+
+
+class _RawStats(object):
+
+    # what pstats.Stats needs to load statistics of a finished profiler
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def _chrome_trace_event(name, category, phase, lane, timestamp, **fields):
+    event = {'name': name, 'cat': category, 'ph': phase, 'pid': lane[0], 'tid': lane[1], 'ts': _us(timestamp)}
+    event.update(fields)
+    return event
+
+
+def _us(seconds):
+    return int(seconds * 1000000)
 
 
 class ResultProxy(object):
@@ -219,7 +1915,7 @@ class ResultProxy(object):
         self.__future__ = future
         future.__original_result__ = future.result
         future.result = types.MethodType(_result_with_proper_traceback, future)
-        future.__current_stack__ = traceback.format_stack()[:-stack_frames_to_pop_off]
+        future.__current_stack__ = _current_stack(stack_frames_to_pop_off)
 
     def __repr__(self):
         return repr(self.__future__.result())
@@ -276,7 +1972,7 @@ class ResultProxy(object):
         return len(self.__future__.result())
 
     def __length_hint__(self):
-        return self.__future__.result().__length_hint__()
+        return getattr(self.__future__.result(), '__length_hint__', lambda: NotImplemented)()
 
     def __getitem__(self, key):
         return self.__future__.result()[key]
@@ -419,6 +2115,444 @@ class ResultProxy(object):
         return self.__future__.result().__getattribute__(name)
 
 
+class ResultSet(object):
+    """
+    The return values of map, evaluated lazily.
+
+    Items are submitted in chunks, one background job each; chunks of plain ints or
+    floats are stored as arrays. A job stops at the first item failing and leaves the
+    rest of its chunk to another job, so failures show up as soon as their item has run.
+    Indexing, slicing and iterating wait for the chunks needed and raise
+    ResultEvaluationError for failed items.
+
+    Generator functions get a job per item; the items are their streaming result proxies.
+    """
+
+    def __init__(self, callable_, blocking_type, iterables, stack_frames_to_pop_off):
+        args_list = list(zip(*iterables))
+        self._callable = callable_
+        self._blocking_type = blocking_type
+        self._pool = _pool(blocking_type, callable_)
+        self._length = len(args_list)
+        if _await_all_policy['return_when'] == FIRST_EXCEPTION:
+            self._chunk_size = 1        # nothing is left to resubmit after a failure
+        else:
+            self._chunk_size = _map_chunk_size(self._length, self._pool, callable_, blocking_type)
+        self._lock = threading.RLock()
+        self._pending = {}              # piece future -> its args while the rest of its items may need a piece
+        self._rests = {}                # piece future -> piece future of the rest of its items
+        self._spans = {}                # piece future -> (index of its first item, number of items)
+        self._watchers = []
+        self._cancelled = False
+        self._current_stack = _current_stack(stack_frames_to_pop_off)
+        if inspect.isgeneratorfunction(callable_):
+            self._chunk_size = 1
+            self._futures = [self._streamed(start, args) for start, args in enumerate(args_list)]
+        else:
+            self._futures = [self._submit(start, args_list[start:start + self._chunk_size]) for start in range(0, self._length, self._chunk_size)]
+        self._chunks = [None] * len(self._futures)
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self[index] for index in range(*key.indices(self._length))]
+        if key < 0:
+            key += self._length
+        if not 0 <= key < self._length:
+            raise IndexError('ResultSet index out of range')
+        values, errors = self._chunk(key // self._chunk_size)
+        offset = key % self._chunk_size
+        if offset in errors:
+            raise ResultEvaluationError(_original_traceback(self._current_stack, errors[offset]))
+        return values[offset]
+
+    def __iter__(self):
+        for index in range(len(self._chunks)):
+            values, errors = self._chunk(index)
+            for offset, value in enumerate(values):
+                if offset in errors:
+                    raise ResultEvaluationError(_original_traceback(self._current_stack, errors[offset]))
+                yield value
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def await_all(self, timeout, return_when, cancel_running):
+        not_done = set(self._futures)
+        if return_when == FIRST_EXCEPTION:
+            while not_done:
+                done, not_done = wait(not_done, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+                failed = []
+                for future in done:
+                    values, errors = self._piece(future)
+                    if errors:
+                        failed.append((self._spans[future][0] + min(errors), errors[min(errors)]))
+                    rest = self._continue(future)
+                    if rest is not None:
+                        not_done.add(rest)
+                if failed:
+                    with self._lock:
+                        self._cancelled = True
+                    _cancel(not_done, cancel_running)
+                    raise ResultEvaluationError(_original_traceback(self._current_stack, min(failed, key=lambda failure: failure[0])[1]))
+        else:
+            wait(not_done, timeout=timeout)
+        return list(self)
+
+    def await_any(self, timeout):
+        wait(self._futures, timeout=timeout, return_when=FIRST_COMPLETED)
+        finished = []
+        for future, start in sorted(self._pieces(), key=lambda piece: piece[1]):
+            if future.done():
+                values, errors = self._piece(future)
+                finished.extend(self._proxy(values[offset], errors.get(offset)) for offset in range(len(values)))
+        return finished
+
+    def _proxy(self, value, error):
+        # a result proxy of a finished item, raising like the ResultSet does
+        future = Future()
+        if error is None:
+            future.set_result(value)
+        else:
+            future.set_exception(error)
+        proxy = ResultProxy(future, 0)
+        future.__current_stack__ = self._current_stack
+        return proxy
+
+    def _streamed(self, start, args):
+        # a done piece whose only item is the streaming result proxy of a job of its own
+        streaming_future = _streaming_future(self._pool, self._blocking_type, self._callable, args, {})
+        proxy = ResultProxy(streaming_future, 0)
+        streaming_future.__current_stack__ = self._current_stack
+        future = Future()
+        future.set_result(([proxy], {}))
+        with self._lock:
+            self._spans[future] = start, 1
+        return future
+
+    def _submit(self, start, args_list, wait=True):
+        # later pieces are submitted by callbacks: to the pool replacing a recycled or broken one, without waiting
+        pool = self._pool if wait else _live_pool(self._pool)
+        try:
+            future = _hedged_job(pool, self._blocking_type, self._callable, _map_chunk, (self._callable, args_list), {}, wait)
+        except BaseException as exc:
+            if wait:
+                raise
+            future = Future()
+            future.set_exception(exc)
+        future.__pool__ = pool
+        with self._lock:
+            self._pending[future] = args_list
+            self._spans[future] = start, len(args_list)
+            watchers = list(self._watchers)
+        future.add_done_callback(self._continue)
+        for watcher in watchers:
+            future.add_done_callback(lambda future, watcher=watcher: watcher(future, start))
+        return future
+
+    def _continue(self, future):
+        # submits the rest of the items of a done piece stopped by a failed item, once
+        with self._lock:
+            if future not in self._pending:
+                return self._rests.get(future)
+            args_list = self._pending.pop(future)
+            done = len(self._piece(future)[0])
+            if done < len(args_list) and not self._cancelled:
+                self._rests[future] = self._submit(self._spans[future][0] + done, args_list[done:], wait=False)
+            return self._rests.get(future)
+
+    def _piece(self, future, timeout=None):
+        try:
+            values, errors = _unwrapped_result(future, timeout)
+            return values, dict(errors)
+        except TimeoutError:
+            raise
+        except BaseException as exc:                    # the whole piece failed, e.g. the pool broke
+            size = self._spans[future][1]
+            return [None] * size, dict((offset, exc) for offset in range(size))
+
+    def _chunk(self, index, timeout=None):
+        chunk = self._chunks[index]
+        if chunk is None:
+            size = min(self._chunk_size, self._length - index * self._chunk_size)
+            future = self._futures[index]
+            values, errors = self._evaluated(future, timeout)
+            while len(values) < size:
+                rest = self._continue(future)
+                if rest is None:                        # not resubmitted after a fail-fast await_all
+                    errors.update((offset, CancelledError()) for offset in range(len(values), size))
+                    values = list(values) + [None] * (size - len(values))
+                    break
+                rest_values, rest_errors = self._evaluated(rest, timeout)
+                errors.update((len(values) + offset, exc) for offset, exc in rest_errors.items())
+                values = _compact(list(values) + list(rest_values))
+                future = rest
+            chunk = self._chunks[index] = values, errors
+        return chunk
+
+    def _evaluated(self, future, timeout):
+        # the piece read for its values; instruments see its first evaluation like that of a proxy
+        record = future.__dict__.get('__record__')
+        if record is not None and record.evaluated is None:
+            _evaluate(future, record, timeout)
+        return self._piece(future, timeout)
+
+    def _watch(self, watcher):
+        # calls watcher(future, start) for each piece done, with the index of its first item
+        with self._lock:
+            self._watchers.append(watcher)
+            spans = list(self._spans.items())
+        for future, (start, size) in spans:
+            future.add_done_callback(lambda future, start=start: watcher(future, start))
+
+    def _pieces(self):
+        # (future, index of its first item) of the pieces submitted so far
+        with self._lock:
+            return [(future, start) for future, (start, size) in self._spans.items()]
+
+
+class _Reduction(object):
+    """
+    Combines the partials of map_reduce covering adjacent ranges of items as they arrive.
+
+    A partial waits in ready until one of its neighbours arrives; then both are combined by
+    a background job whose result is a partial again. The partial covering all items is the result.
+    """
+
+    def __init__(self, future, pool, reducer, length):
+        self.future = future
+        self.pool = pool
+        self.reducer = reducer
+        self.length = length
+        self.ready = {}                 # start -> (stop, value) of partials waiting for a neighbour
+        self.start_of = {}              # stop -> start of these partials
+        self.lock = threading.Lock()
+
+    def watch(self, partial_future, start, stop):
+        partial_future.add_done_callback(lambda partial_future: self.arrived(partial_future, start, stop))
+
+    def arrived(self, partial_future, start, stop):
+        try:
+            value = _unwrapped_result(partial_future)
+        except BaseException as exc:
+            return self.fail(exc)
+        while True:
+            with self.lock:
+                if self.future.done():
+                    return
+                if start == 0 and stop == self.length:
+                    self.future.set_result(value)
+                    return
+                if start in self.start_of:
+                    start = self.start_of.pop(start)
+                    left_value, right_value = self.ready.pop(start)[1], value
+                elif stop in self.ready:
+                    right_stop, right_value = self.ready.pop(stop)
+                    del self.start_of[right_stop]
+                    stop, left_value = right_stop, value
+                else:
+                    self.ready[start] = stop, value
+                    self.start_of[stop] = start
+                    return
+            try:
+                # submitted directly: admission by memory budget could block the thread delivering results
+                return self.watch(_submit_to(_live_pool(self.pool), _safety_wrapper, self.reducer, left_value, right_value), start, stop)
+            except RuntimeError:                        # the pool has been shut down meanwhile; combine right here
+                pass
+            try:
+                value = self.reducer(left_value, right_value)
+            except BaseException as exc:
+                return self.fail(exc)
+
+    def fail(self, exc):
+        with self.lock:
+            if self.future.done():
+                return
+            self.future.set_exception(exc)
+
+
+class _ResourceGroup(object):
+    """
+    Admits the jobs of io-bound callables sharing a resource to their pool: at most limit
+    of them run at once and at most rate of them start per second. The others wait here
+    instead of in the pool, so they take no thread away from jobs of other groups.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.limit = None
+        self.rate = None
+        self.reset()
+
+    def reset(self):
+        self.running = 0
+        self.waiting = collections.deque()
+        self.next_start = 0.0           # earliest start of the next job according to rate
+        self.woken = False              # whether a timer is going to dispatch rate-limited jobs
+        self.lock = threading.Lock()
+
+    def configure(self, limit, rate):
+        with self.lock:
+            self.limit = limit or self.limit
+            self.rate = rate or self.rate
+        return self
+
+    def submit(self, pool, blocking_type, origin, callable_, args, kwargs):
+        future = Future()
+        with self.lock:
+            self.waiting.append((future, pool, blocking_type, origin, callable_, args, kwargs))
+        self.dispatch()
+        return future
+
+    def dispatch(self):
+        while True:
+            with self.lock:
+                if not self.waiting or (self.limit and self.running >= self.limit):
+                    return
+                now = time.time()
+                if self.rate and now < self.next_start:
+                    if not self.woken:
+                        self.woken = True
+                        _schedule(self.next_start - now, self.wake)
+                    return
+                future, pool, blocking_type, origin, callable_, args, kwargs = self.waiting.popleft()
+                if not future.set_running_or_notify_cancel():
+                    continue                        # cancelled while waiting
+                self.running += 1
+                if self.rate:
+                    self.next_start = max(now, self.next_start) + 1.0 / self.rate
+            try:
+                job = _pool_submit(pool, blocking_type, origin, callable_, *args, **kwargs)
+            except BaseException as exc:            # e.g. the pool has been shut down meanwhile
+                self.finished(None, future, exc)
+                continue
+            job.add_done_callback(lambda job, future=future: self.finished(job, future))
+
+    def wake(self):
+        with self.lock:
+            self.woken = False
+        self.dispatch()
+
+    def finished(self, job, future, exc=None):
+        with self.lock:
+            self.running -= 1
+        if exc is None:
+            try:
+                value = _unwrapped_result(job)
+            except BaseException as job_exc:
+                exc = job_exc
+        if exc is None:
+            future.set_result(value)
+        else:
+            future.set_exception(exc)
+        self.dispatch()
+
+
+class _Hedge(object):
+    """
+    Runs a job of a hedged callable as attempts: a duplicate is submitted when the attempts
+    run longer than the threshold learned from past run times, a failed attempt is retried.
+
+    The future gets the result of the first attempt succeeding or the exception of the last
+    attempt failing; the remaining attempts are cancelled when the future is done.
+    """
+
+    def __init__(self, pool, blocking_type, origin, callable_, args, kwargs, hedging, wait=True):
+        self.future = Future()
+        self.pool = pool
+        self.blocking_type = blocking_type
+        self.origin = origin
+        self.callable_ = callable_
+        self.args = args
+        self.kwargs = kwargs
+        self.key = (_name_of(origin), _name_of(callable_))
+        self.percentile = hedging['percentile']
+        self.hedges = hedging['hedges']
+        self.retries = hedging['retries']
+        self.attempts = {}              # attempt future -> submission time
+        self.settled = False
+        self.lock = threading.Lock()
+        self.future.add_done_callback(self.cancel_attempts)
+        self.attempt(wait)
+        self.schedule_check()
+
+    def attempt(self, wait=False):
+        # later attempts are submitted by callbacks and timers: to the pool replacing a recycled or broken one, without waiting for admission
+        attempt = _limited_submit(_live_pool(self.pool), self.blocking_type, self.origin, self.callable_, self.args, self.kwargs, wait)
+        with self.lock:
+            self.attempts[attempt] = time.time()
+        attempt.add_done_callback(self.done)
+
+    def schedule_check(self):
+        threshold = _hedge_threshold(self.key, self.percentile) if self.hedges else None
+        if threshold is not None:
+            _schedule(threshold, self.check)
+
+    def check(self):
+        with self.lock:
+            if self.settled or self.future.done() or not self.hedges:
+                return
+            # a duplicate of a queued job would only queue up behind it
+            straggling = any(attempt.running() for attempt in self.attempts)
+            if straggling:
+                self.hedges -= 1
+        if straggling:
+            try:
+                self.attempt()
+            except BaseException as exc:            # e.g. the pool has been shut down meanwhile
+                return self.settle(exception=exc)
+        self.schedule_check()
+
+    def done(self, attempt):
+        if attempt.cancelled():
+            return
+        try:
+            value = _unwrapped_result(attempt)
+        except BaseException as exc:
+            with self.lock:
+                retry = not self.settled and self.retries > 0
+                if retry:
+                    self.retries -= 1
+                elif any(not other.done() for other in self.attempts):
+                    return                          # another attempt may still succeed
+            if not retry:
+                return self.settle(exception=exc)
+            try:
+                return self.attempt()
+            except BaseException as exc:
+                return self.settle(exception=exc)
+        _learn_latency(self.key, time.time() - self.attempts[attempt])
+        self.settle(value)
+
+    def settle(self, value=None, exception=None):
+        with self.lock:
+            if self.settled or not self.future.set_running_or_notify_cancel():
+                return
+            self.settled = True
+        if exception is None:
+            self.future.set_result(value)
+        else:
+            self.future.set_exception(exception)
+
+    def cancel_attempts(self, future):
+        with self.lock:
+            attempts = list(self.attempts)
+        for attempt in attempts:
+            attempt.cancel()
+
+
 class OperatorFuture(object):
 
     _result = None
@@ -501,19 +2635,48 @@ class OperatorFuture(object):
 
 
 def _result_with_proper_traceback(future, timeout=None):
+    record = future.__dict__.get('__record__')
+    if record is not None and record.evaluated is None:
+        _evaluate(future, record, timeout)
     try:
-        return future.__original_result__(timeout)
+        result = future.__original_result__(timeout)
+        return result.result if record is not None else result
     except ResultEvaluationError:           # exception carrying original tracebacks
         raise
-    except TransportException as exc:       # exception from the fork
-        traceback_info = exc.traceback_info
-    except BaseException as exc:            # exception from OperatorFuture
-        traceback_info = traceback.format_exception_only(type(exc), exc)
-
-    original_traceback = '\n    '.join(''.join(['\n\nOriginal Traceback (most recent call last):\n'] + future.__current_stack__ + traceback_info).split('\n'))
+    except BaseException as exc:            # exception from the fork or from OperatorFuture
+        original_traceback = _original_traceback(future.__current_stack__, exc)
     raise ResultEvaluationError(original_traceback)
 
 
+def _original_traceback(current_stack, exc):
+    return _OriginalTraceback(current_stack, exc)
+
+
+class _OriginalTraceback(object):
+    """
+    The stack a job was submitted from followed by the traceback of the job; formatted only
+    when the ResultEvaluationError carrying it is displayed or its args are accessed.
+    """
+
+    def __init__(self, current_stack, exc):
+        self.current_stack = current_stack
+        self.exc = exc
+        self.text = None
+
+    def __str__(self):
+        if self.text is None:
+            if isinstance(self.exc, TransportException):
+                frames, exception_lines = self.exc.traceback_info
+            else:
+                frames, exception_lines = (), traceback.format_exception_only(type(self.exc), self.exc)
+            lines = ['\n\nOriginal Traceback (most recent call last):\n'] + _format_frames(self.current_stack) + _format_frames(frames) + list(exception_lines)
+            self.text = '\n    '.join(''.join(lines).split('\n'))
+        return self.text
+
+    def __repr__(self):
+        return repr(str(self))
+
+
 # aliases
 go = submit
 fork = submit
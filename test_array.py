@@ -0,0 +1,78 @@
+from __future__ import print_function
+import fork
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@fork.cpu_bound
+def scale(block):
+    return block * 2 + 1
+
+
+@fork.cpu_bound
+def halve(block):
+    return block[::2]
+
+
+added_shapes = []
+
+
+@fork.io_bound
+def add(a, b):
+    added_shapes.append(a.shape)        # threads share the list
+    return a + b
+
+
+def test_array_blocks():
+    print('##### test_array_blocks #####')
+    print(fork._array_blocks(10, 1 << 20, None, 4) == [(0, 2), (2, 5), (5, 7), (7, 10)])
+    print(fork._array_blocks(3, 1 << 20, 8, 4) == [(0, 1), (1, 2), (2, 3)])
+    print(fork._array_blocks(1000, 1 << 10, None, 4) == [(0, 1000)])
+    print(fork._array_blocks(1000, 1 << 10, 2, 4) == [(0, 500), (500, 1000)])
+
+
+def test_block_map_array_process():
+    print('##### test_block_map_array_process #####')
+    array_ = numpy.arange(100000, dtype=numpy.float64).reshape(50000, 2)
+    result = fork.block_map_array(scale, array_, blocks=4)
+    print((result == array_ * 2 + 1).all())
+
+
+def test_block_map_array_thread_axis():
+    print('##### test_block_map_array_thread_axis #####')
+    a = numpy.arange(60).reshape(3, 20)
+    b = numpy.ones((3, 20), dtype=numpy.int64)
+    result = fork.block_map_array(add, (a, b), axis=1, blocks=3)
+    print((result == a + b).all(), sorted(added_shapes) == [(3, 6), (3, 7), (3, 7)])
+
+
+def test_block_map_array_negative_axis():
+    print('##### test_block_map_array_negative_axis #####')
+    a = numpy.arange(120000, dtype=numpy.float64).reshape(3, 40000)
+    result = fork.block_map_array(scale, a, axis=-1, blocks=4)
+    print(result.shape == a.shape and (result == a * 2 + 1).all())
+    try:
+        fork.block_map_array(scale, a, axis=2)
+    except ValueError as exc:
+        print('ValueError:', exc)
+
+
+def test_block_map_array_shape_mismatch():
+    print('##### test_block_map_array_shape_mismatch #####')
+    try:
+        fork.block_map_array(halve, numpy.zeros(100000), blocks=2)
+    except ValueError as exc:
+        print('ValueError:', exc)
+
+
+test_array_blocks()
+if numpy is None:
+    print('numpy not installed, skipping block_map_array tests')
+else:
+    test_block_map_array_process()
+    test_block_map_array_thread_axis()
+    test_block_map_array_negative_axis()
+    test_block_map_array_shape_mismatch()
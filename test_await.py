@@ -1,4 +1,10 @@
+import gc
 import time
+import os
+import tempfile
+import zlib
+import operator
+import itertools
 from fork import *
 
 
@@ -13,6 +19,165 @@ def webservice():
     return 'result'
 
 
+@cpu_bound
+def slow_or_failing(n):
+    if n == 3:
+        raise RuntimeError('task 3 failed')
+    time.sleep(1)
+    return n
+
+
+@cpu_bound
+def fib_stream(n):
+    for i in range(n):
+        yield fib(i)
+
+
+@io_bound
+def webservice_stream(n):
+    for i in range(n):
+        yield webservice()
+
+
+@io_bound
+def webservice_list(i):
+    return [webservice() + str(i)]
+
+
+stalled = set()
+
+
+@hedged(percentile=90, retries=1)
+@io_bound
+def straggling_webservice(i):
+    if i % 10 == 9 and i not in stalled:
+        stalled.add(i)
+        time.sleep(2)
+    return webservice()
+
+
+@hedged(retries=1)
+@io_bound
+def flaky_webservice(i):
+    if i not in stalled:
+        stalled.add(i)
+        raise IOError('connection reset')
+    return webservice()
+
+
+@hedged(retries=1)
+@peak_memory(1)
+@cpu_bound
+def flaky_computation(marker):
+    if not os.path.exists(marker):
+        open(marker, 'w').close()
+        time.sleep(0.5)
+        raise IOError('worker lost')
+    return 'recovered'
+
+
+@hedged(retries=1)
+@peak_memory(60)
+@cpu_bound
+def crashing_computation(marker):
+    if not os.path.exists(marker):
+        open(marker, 'w').close()
+        os._exit(1)
+    return 'survived'
+
+
+@peak_memory(100)
+@cpu_bound
+def memory_hungry():
+    time.sleep(0.5)
+    return 'done'
+
+
+db_connections = set()
+
+
+@io_bound(limit=1, group='db')
+def query(i):
+    db_connections.add(i)
+    busy = len(db_connections)
+    time.sleep(0.05)
+    db_connections.discard(i)
+    return busy
+
+
+@io_bound(rate=20)
+def paced_webservice(i):
+    return webservice()
+
+
+@nogil_bound
+def compress(data):
+    return len(zlib.compress(data, 9))
+
+
+batch = executor('batch', processes=1)
+interactive = executor('interactive', processes=1, borrow=True)
+
+
+@batch
+@cpu_bound
+def batch_job(seconds):
+    time.sleep(seconds)
+    return os.getpid()
+
+
+nested = executor('nested', threads=1)
+
+
+@nested
+@io_bound
+def nested_job(depth):
+    return await(submit(nested_job, depth - 1), timeout=5) + 1 if depth else 0
+
+
+computed = []
+
+
+@io_bound
+def square(i):
+    computed.append(i)
+    return i * i
+
+
+@cpu_bound
+def slow_second_item():
+    yield 1
+    time.sleep(2)
+    yield 2
+
+
+def endless_stream(marker):
+    try:
+        for i in itertools.count():
+            yield i
+    finally:
+        open(marker, 'w').close()
+
+
+initialized = []
+
+
+def remember_initialization(directory):
+    initialized.append(directory)
+    open(os.path.join(directory, str(os.getpid())), 'w').close()
+
+
+@cpu_bound
+def initialization():
+    import json
+    return len(initialized)
+
+
+@cpu_bound
+def worker_pid():
+    return os.getpid()
+
+
 def test_cpu_bound_await(n):
     print('##### test_cpu_bound_await #####')
     print(await(process(fib, n)))
@@ -25,7 +190,31 @@ def test_cpu_bound_await_all(n):
 
 def test_cpu_bound_await_any(n):
     print('##### test_cpu_bound_await_any #####')
-    print(await_any(map_process(fib, range(n))))
+    finished = await_any(map_process(fib, range(n)))
+    print(finished, 'result proxies:', all(hasattr(result, '__future__') for result in finished))
+
+
+def test_cpu_bound_block_map_fail_fast(n):
+    print('##### test_cpu_bound_block_map_fail_fast #####')
+    set_await_all_policy(FIRST_EXCEPTION)
+    start = time.time()
+    try:
+        block_map(slow_or_failing, None, range(n))
+    except ResultEvaluationError:
+        print('failed fast:', time.time()-start < n / 2)
+    set_await_all_policy()
+
+
+def test_cpu_bound_cancel_running_spares_others():
+    print('##### test_cpu_bound_cancel_running_spares_others #####')
+    configure_processes(max_workers=4)
+    other = process(slow_or_failing, 4)
+    try:
+        await_all([process(slow_or_failing, i) for i in (3, 5)], return_when=FIRST_EXCEPTION, cancel_running=True)
+    except ResultEvaluationError:
+        pass
+    print('other job survived:', await(other, timeout=10) == 4)
+    configure_processes(reset=True)
 
 
 def test_io_bound_await(n):
@@ -43,9 +232,207 @@ def test_io_bound_await_any(n):
     print(await_any([thread(webservice) for i in range(n)]))
 
 
+def test_cpu_bound_await_all_fail_fast(n):
+    print('##### test_cpu_bound_await_all_fail_fast #####')
+    start = time.time()
+    try:
+        await_all(map_process(slow_or_failing, range(n)), return_when=FIRST_EXCEPTION)
+    except ResultEvaluationError:
+        print('failed after', time.time()-start)
+
+
+def test_cpu_bound_stream(n):
+    print('##### test_cpu_bound_stream #####')
+    print(list(process(fib_stream, n)))
+    streams = map_process(fib_stream, [n, n])
+    print(isinstance(streams, ResultSet), [list(stream) for stream in streams])
+
+
+def test_io_bound_stream(n):
+    print('##### test_io_bound_stream #####')
+    print(list(thread(webservice_stream, n)))
+
+
+def test_cpu_bound_map_reduce(n):
+    print('##### test_cpu_bound_map_reduce #####')
+    print(await(map_reduce(fib, operator.add, range(n))))
+
+
+def test_cpu_bound_map_reduce_recycled(n):
+    print('##### test_cpu_bound_map_reduce_recycled #####')
+    total = map_reduce(slow_or_failing, operator.add, range(4, 4 + n))
+    configure_processes(max_tasks_per_worker=1)
+    await(process(fib, 1))        # replaces the pool the partials are combined in
+    print(await(total) == sum(range(4, 4 + n)))
+    configure_processes(reset=True)
+
+
+def test_io_bound_map_reduce(n):
+    print('##### test_io_bound_map_reduce #####')
+    print(await(map_reduce(webservice_list, operator.add, range(n))))
+
+
+def test_io_bound_hedged(n):
+    print('##### test_io_bound_hedged #####')
+    await_all([thread(straggling_webservice, 10*i) for i in range(20)])
+    start = time.time()
+    await_all([thread(straggling_webservice, i) for i in range(n)])
+    print('stragglers overtaken:', time.time()-start < 1)
+    print(await_all([thread(flaky_webservice, 1000+i) for i in range(3)]))
+    print(list(map(flaky_webservice, range(2000, 2003))))
+
+
+def test_cpu_bound_hedged_retry():
+    print('##### test_cpu_bound_hedged_retry #####')
+    configure_processes(max_workers=1, memory_budget=100)
+    marker = os.path.join(tempfile.mkdtemp(), 'failed')
+    result = fork(flaky_computation, marker)
+    configure_processes(max_tasks_per_worker=1)
+    hungry = fork(memory_hungry)        # recycles the pool and waits for the first attempt to fail
+    print(await(result, timeout=10), await(hungry, timeout=10))
+    configure_processes(reset=True)
+
+
+def test_cpu_bound_hedged_retry_crash():
+    print('##### test_cpu_bound_hedged_retry_crash #####')
+    configure_processes(max_workers=1, memory_budget=100)
+    marker = os.path.join(tempfile.mkdtemp(), 'crashed')
+    print(await(fork(crashing_computation, marker), timeout=10), await(fork(memory_hungry), timeout=10))
+    configure_processes(reset=True)
+
+
+def test_io_bound_limit(n):
+    print('##### test_io_bound_limit #####')
+    queries = [thread(query, i) for i in range(n)]
+    start = time.time()
+    await(thread(webservice))
+    print('others keep flowing:', time.time()-start < 0.05)
+    print('max concurrent queries:', max(await_all(queries)))
+    start = time.time()
+    await_all(map(paced_webservice, range(n)))
+    print('calls paced:', time.time()-start >= (n-1)/20.0)
+
+
+def test_nogil_bound_await_all(n):
+    print('##### test_nogil_bound_await_all #####')
+    print(await_all(map(compress, [b'x' * 2**i for i in range(n)])))
+
+
+def test_cpu_bound_thread_backend():
+    print('##### test_cpu_bound_thread_backend #####')
+    directory = tempfile.mkdtemp()
+    configure_processes(backend='threads', max_workers=2, initializer=remember_initialization, initargs=(directory,))
+    print('ran in this process:', await(process(worker_pid)) == os.getpid())
+    print('threads initialized:', all(await_all([process(initialization) for i in range(4)])))
+    configure_processes(reset=True)
+
+
+def test_executor_partitions():
+    print('##### test_executor_partitions #####')
+    batch_pid = await(submit(batch_job, 0))
+    interactive_pid = await(interactive.submit(worker_pid))
+    start = time.time()
+    job = submit(batch_job, 1)
+    await(interactive.submit(worker_pid))
+    print('interactive job did not queue behind batch job:', time.time()-start < 1)
+    await(job)
+    print('borrowed idle batch worker:', set(await_all([interactive.submit(batch_job, 0.2) for i in range(2)])) == set([batch_pid, interactive_pid]))
+    try:
+        with batch:
+            await_all([process(slow_or_failing, i) for i in (3, 5)], return_when=FIRST_EXCEPTION, cancel_running=True)
+    except ResultEvaluationError:
+        pass
+    print('batch works after cancel_running:', await(submit(batch_job, 0)) != batch_pid)
+    print('nested jobs of a full partition:', await(submit(nested_job, 2), timeout=10))
+
+
+def test_checkpoint(n):
+    print('##### test_checkpoint #####')
+    path = os.path.join(tempfile.mkdtemp(), 'checkpoint.sqlite')
+    with checkpoint(path):
+        block_map(square, None, range(n // 2))
+    del computed[:]
+    with checkpoint(path):
+        print(block_map(square, None, range(n)))
+    print('computed again:', sorted(computed))
+    print('write-ahead log left:', os.path.exists(path + '-wal'))
+
+
+def test_stream_first_item():
+    print('##### test_stream_first_item #####')
+    for submit_ in [process, thread]:
+        start = time.time()
+        items = iter(submit_(slow_second_item))
+        next(items)
+        print('first item before the second is produced:', time.time()-start < 1)
+        print(list(items))
+
+
+def test_stream_break():
+    print('##### test_stream_break #####')
+    for submit_ in [process, thread]:
+        marker = os.path.join(tempfile.mkdtemp(), 'closed')
+        for item in submit_(endless_stream, marker):
+            break
+        gc.collect()
+        start = time.time()
+        while not os.path.exists(marker) and time.time()-start < 5:
+            time.sleep(0.01)
+        print('worker stopped after break:', os.path.exists(marker))
+
+
+def test_warmup():
+    print('##### test_warmup #####')
+    warmup()
+    start = time.time()
+    await(process(fib, 0))
+    print('first call after warmup:', time.time()-start)
+
+
+def test_worker_initializer():
+    print('##### test_worker_initializer #####')
+    directory = tempfile.mkdtemp()
+    configure_processes(max_workers=2, initializer=remember_initialization, initargs=(directory,), preload=['json'])
+    warmup()
+    print('workers initialized by warmup:', len(os.listdir(directory)))
+    print(await_all([process(initialization) for i in range(4)]))
+    configure_processes(reset=True)
+
+
+def test_worker_recycling(n):
+    print('##### test_worker_recycling #####')
+    configure_processes(max_workers=1, max_tasks_per_worker=2)
+    print('workers used:', len(set(await(process(worker_pid)) for i in range(n))))
+    configure_processes(max_workers=2, max_tasks_per_worker=2)      # counted per worker, not per pool
+    pids = [await(process(worker_pid)) for i in range(n)]
+    print('jobs per worker at most 2:', max(pids.count(pid) for pid in pids) <= 2)
+    configure_processes(reset=True)
+
+
 test_cpu_bound_await(10)
 test_cpu_bound_await_all(10)
 test_cpu_bound_await_any(10)
+test_cpu_bound_await_all_fail_fast(100)
+test_cpu_bound_block_map_fail_fast(100)
+test_cpu_bound_cancel_running_spares_others()
 test_io_bound_await(10)
 test_io_bound_await_all(10)
 test_io_bound_await_any(10)
+test_cpu_bound_stream(10)
+test_io_bound_stream(10)
+test_stream_first_item()
+test_stream_break()
+test_cpu_bound_map_reduce(20)
+test_cpu_bound_map_reduce_recycled(2)
+test_io_bound_map_reduce(30)
+test_io_bound_limit(10)
+test_io_bound_hedged(10)
+test_cpu_bound_hedged_retry()
+test_cpu_bound_hedged_retry_crash()
+test_nogil_bound_await_all(10)
+test_executor_partitions()
+test_checkpoint(10)
+test_warmup()
+test_worker_initializer()
+test_worker_recycling(6)
+test_cpu_bound_thread_backend()
@@ -41,9 +41,25 @@ def io_c():
     pass
 
 
+@peak_memory(60)
+@cpu_bound
+def budgeted_outer():
+    return await(fork(budgeted_inner), timeout=5)
+
+@peak_memory(60)
+@cpu_bound
+def budgeted_inner():
+    return 'budgeted_inner'
+
+
 
 fork(cpu_a)
 fork(io_a)
 
 fork(fork, fork, fork, fork, fork, cpu_a)
 fork(fork, fork, fork, fork, fork, io_a)
+
+
+configure_processes(max_workers=2, memory_budget=100)    # workers forked after admission
+print(await(fork(budgeted_outer), timeout=10))
+configure_processes(reset=True)
@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 
 import re
+import sys
+import pickle
 import traceback
 from fork import *
+from fork import _transport_exception
 
 
 @cpu_bound
@@ -21,6 +24,9 @@ def runtime_error_io():
 def operator_error_io():
     return ''
 
+def value_error(i):
+    raise ValueError('item {i}'.format(i=i))
+
 
 def test_cpu_bound_fork_runtime_error():
     print('##### test_cpu_bound_fork_runtime_error #####')
@@ -134,6 +140,26 @@ def test_io_bound_thread_operator_error():
             print(given_traceback.strip())
 
 
+def test_transported_stacks_shared():
+    print('##### test_transported_stacks_shared #####')
+    transported = []
+    for i in range(2):
+        try:
+            value_error(i)
+        except ValueError as exc:
+            transported.append(_transport_exception(exc, sys.exc_info()[2]))
+    first, second = pickle.loads(pickle.dumps(transported))
+    print('stack shared:', first.traceback_info[0] is second.traceback_info[0])
+
+
+def test_error_message_is_string():
+    print('##### test_error_message_is_string #####')
+    try:
+        await(thread(runtime_error_io))
+    except ResultEvaluationError as exc:
+        print('message is a string:', isinstance(exc.args[0], str) and exc.args[0] == str(exc))
+
+
 wanted_runtime_traceback = \
 r'''
 Traceback \(most recent call last\):
@@ -184,3 +210,6 @@ test_cpu_bound_fork_operator_error()
 test_cpu_bound_process_operator_error()
 test_io_bound_fork_operator_error()
 test_io_bound_thread_operator_error()
+
+test_transported_stacks_shared()
+test_error_message_is_string()
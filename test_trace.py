@@ -0,0 +1,66 @@
+import json
+import time
+import tempfile
+from fork import *
+
+
+@cpu_bound
+def fib(n):
+    return 1 if n <= 1 else fib(n-1) + fib(n-2)
+
+@io_bound
+def webservice():
+    time.sleep(0.001)
+    return 'result'
+
+
+def test_trace_chrome_export(n):
+    print('##### test_trace_chrome_export #####')
+    with Tracer() as tracer:
+        results = 0
+        for i in [20]*n:
+            results += fork(fib, i)
+        str(results)
+        str([fork(webservice) for i in range(n)])
+    with tempfile.TemporaryFile('w+') as f:
+        tracer.export_chrome_trace(f)
+        f.seek(0)
+        events = json.load(f)['traceEvents']
+    print('jobs recorded:', len(tracer.records))
+    for category in ['run', 'queue', 'evaluate']:
+        print(category, 'events:', len([event for event in events if event.get('cat') == category]))
+    print('worker processes:', len([event for event in events if event['ph'] == 'M']) - 1)
+    print('pickled sizes recorded:', any(record.args_size is not None for record in tracer.records))
+
+
+def test_profile_merged_stats(n):
+    print('##### test_profile_merged_stats #####')
+    with Profiler() as profiler:
+        str([fork(fib, i) for i in [20]*n])
+        str([fork(webservice) for i in range(n)])
+    print('profiled callables:', sorted(profiler.stats_of))
+    stats = profiler.stats()
+    fib_calls = [calls for (filename, line, name), (primitive_calls, calls, tt, ct, callers) in stats.stats.items() if name == 'fib']
+    print('fib calls:', sum(fib_calls))
+
+
+def test_metrics_stats(n):
+    print('##### test_metrics_stats #####')
+    enable_metrics(pickled_sizes=True)
+    str([fork(fib, i) for i in [20]*n])
+    str([fork(webservice) for i in range(n)])
+    str(list(map(fib, [20]*n)))
+    snapshot = stats()
+    disable_metrics()
+    for name, metrics_of in sorted(snapshot['callables'].items()):
+        for blocking_type, metrics in metrics_of.items():
+            print(name, blocking_type, 'submitted:', metrics['submitted'], 'finished:', metrics['finished'], 'calls:', metrics['calls'],
+                  'run times:', metrics['run_time']['count'], 'evaluate waits:', metrics['evaluate_wait']['count'],
+                  'pickled:', metrics['args_bytes'] > 0)
+    for blocking_type, pool in sorted(snapshot['pools'].items()):
+        print(blocking_type, 'in flight:', pool['in_flight'])
+
+
+test_trace_chrome_export(10)
+test_profile_merged_stats(10)
+test_metrics_stats(10)